@@ -8,26 +8,183 @@ SRC_DIR = PROJECT_ROOT / "src"
 if str(SRC_DIR) not in sys.path:
     sys.path.insert(0, str(SRC_DIR))
 
-from brokerage_notes_monitor.app import run
+# Importações pesadas (pandas, openpyxl, PyPDF2) ficam dentro de cada comando:
+# `--help` e `validate-config` não devem pagar por elas.
 
+COMMANDS = ("run", "ingest", "compact", "backfill", "validate-config", "stats", "query", "positions-rebuild", "compare-backends")
 
-def parse_args():
-    p = argparse.ArgumentParser(
-        description="Monitor de notas de corretagem - Extração PDF -> Excel + flags de compliance."
+
+def cmd_run(args) -> int:
+    from brokerage_notes_monitor.app import run
+
+    run(config_path=args.config, dry_run=args.dry_run)
+    return 0
+
+
+def cmd_ingest(args) -> int:
+    from brokerage_notes_monitor.app import ingest
+
+    ingest(config_path=args.config)
+    return 0
+
+
+def cmd_compact(args) -> int:
+    from brokerage_notes_monitor.app import compact
+
+    compact(config_path=args.config)
+    return 0
+
+
+def cmd_backfill(args) -> int:
+    from brokerage_notes_monitor.backfill import run_backfill
+
+    run_backfill(config_path=args.config, restart=args.restart)
+    return 0
+
+
+def cmd_validate_config(args) -> int:
+    from brokerage_notes_monitor.config import Config
+
+    try:
+        cfg = Config.load(args.config)
+    except (OSError, ValueError, KeyError, TypeError) as e:
+        print(f"Config inválido ({args.config}): {e!r}")
+        return 1
+
+    problems = cfg.validate()
+    if problems:
+        print(f"Config inválido ({args.config}):")
+        for prob in problems:
+            print(f"  - {prob}")
+        return 1
+
+    print(f"Config OK: {args.config}")
+    return 0
+
+
+def cmd_stats(args) -> int:
+    from brokerage_notes_monitor.app import show_stats
+
+    show_stats(config_path=args.config)
+    return 0
+
+
+def cmd_query(args) -> int:
+    from brokerage_notes_monitor.app import query_history
+
+    query_history(
+        config_path=args.config,
+        cliente=args.cliente,
+        assessor=args.assessor,
+        data_de=args.de,
+        data_ate=args.ate,
+        flag=args.flag,
+        apenas_sinalizadas=args.sinalizadas,
+        output=args.output,
     )
-    p.add_argument(
+    return 0
+
+
+def cmd_positions_rebuild(args) -> int:
+    from brokerage_notes_monitor.app import rebuild_positions
+
+    divergencias = rebuild_positions(config_path=args.config, check=args.check)
+    return 1 if divergencias and args.check else 0
+
+
+def cmd_compare_backends(args) -> int:
+    from brokerage_notes_monitor.app import compare_extraction_backends
+
+    compare_extraction_backends(
+        config_path=args.config,
+        backends=[b.strip() for b in args.backends.split(",") if b.strip()],
+    )
+    return 0
+
+
+def parse_args(argv=None):
+    argv = list(sys.argv[1:] if argv is None else argv)
+    # Compatibilidade: `main.py --config x [--dry-run]` continua equivalendo a `run`
+    if argv and argv[0] not in COMMANDS and argv[0] not in ("-h", "--help"):
+        argv.insert(0, "run")
+
+    comum = argparse.ArgumentParser(add_help=False)
+    comum.add_argument(
         "--config",
         required=True,
         help="Caminho do config.json (baseado em configs/config.example.json).",
     )
-    p.add_argument(
+
+    p = argparse.ArgumentParser(
+        description="Monitor de notas de corretagem - Extração PDF -> Excel + flags de compliance."
+    )
+    sub = p.add_subparsers(dest="command", required=True)
+
+    sp = sub.add_parser("run", parents=[comum], help="Extrai PDFs, aplica flags e atualiza o histórico.")
+    sp.add_argument(
         "--dry-run",
         action="store_true",
-        help="Executa extração e dedup, mas não salva Excel.",
+        help="Executa extração e dedup, mas não salva Excel nem journal.",
+    )
+    sp.set_defaults(func=cmd_run)
+
+    sp = sub.add_parser(
+        "ingest",
+        parents=[comum],
+        help="Extrai PDFs para o journal sem gravar o histórico (pode rodar em paralelo).",
+    )
+    sp.set_defaults(func=cmd_ingest)
+
+    sp = sub.add_parser("compact", parents=[comum], help="Consolida o journal no histórico (com lock).")
+    sp.set_defaults(func=cmd_compact)
+
+    sp = sub.add_parser(
+        "backfill",
+        parents=[comum],
+        help="Carga histórica grande com orçamento de memória (retoma de onde parou).",
+    )
+    sp.add_argument(
+        "--restart",
+        action="store_true",
+        help="Descarta o checkpoint de um backfill interrompido e recomeça.",
+    )
+    sp.set_defaults(func=cmd_backfill)
+
+    sp = sub.add_parser("validate-config", parents=[comum], help="Valida o config sem processar nada.")
+    sp.set_defaults(func=cmd_validate_config)
+
+    sp = sub.add_parser("stats", parents=[comum], help="Resumo do histórico (contagens e flags).")
+    sp.set_defaults(func=cmd_stats)
+
+    sp = sub.add_parser("query", parents=[comum], help="Filtra operações do histórico.")
+    sp.add_argument("--cliente", help="Código do cliente.")
+    sp.add_argument("--assessor", help="Código do assessor.")
+    sp.add_argument("--de", help="Data de pregão inicial (AAAA-MM-DD).")
+    sp.add_argument("--ate", help="Data de pregão final (AAAA-MM-DD).")
+    sp.add_argument("--flag", help="Coluna de flag (ex.: is_daytrade).")
+    sp.add_argument("--sinalizadas", action="store_true", help="Apenas operações com flag_alerta.")
+    sp.add_argument("--output", help="Salva o resultado em .csv ou .xlsx em vez de imprimir.")
+    sp.set_defaults(func=cmd_query)
+
+    sp = sub.add_parser(
+        "positions-rebuild",
+        parents=[comum],
+        help="Recalcula as posições a partir do histórico e compara com o estado incremental.",
+    )
+    sp.add_argument(
+        "--check",
+        action="store_true",
+        help="Só confere (não grava); sai com código 1 se o estado incremental divergir do recalculado.",
     )
-    return p.parse_args()
+    sp.set_defaults(func=cmd_positions_rebuild)
+
+    sp = sub.add_parser("compare-backends", parents=[comum], help="Compara backends de extração nos PDFs de entrada.")
+    sp.add_argument("backends", help="Lista separada por vírgulas (ex.: pypdf2,pymupdf).")
+    sp.set_defaults(func=cmd_compare_backends)
+
+    return p.parse_args(argv)
 
 
 if __name__ == "__main__":
     args = parse_args()
-    run(config_path=args.config, dry_run=args.dry_run)
+    sys.exit(args.func(args))
@@ -1,8 +1,18 @@
 __all__ = [
+    "alerts",
     "app",
+    "backfill",
+    "backend_bench",
     "config",
+    "discovery",
+    "journal",
     "logging_config",
+    "partition_store",
     "pdf_extract",
+    "pdf_io",
+    "positions",
     "rules",
     "excel_store",
+    "summary_store",
+    "text_backends",
 ]
@@ -0,0 +1,191 @@
+from __future__ import annotations
+
+import json
+import logging
+import os
+import time
+import urllib.error
+import urllib.request
+from pathlib import Path
+from typing import Any
+
+import pandas as pd
+
+from .journal import HistoryLock
+
+logger = logging.getLogger("brokerage_notes_monitor.alerts")
+
+
+ALERT_COLUMNS = [
+    "id_operacao",
+    "arquivo_pdf", "pagina", "numero_nota", "data_pregao",
+    "codigo_cliente", "nome_cliente", "assessor",
+    "layout_origem", "cv", "tipo_mercado", "ativo",
+    "quantidade", "preco", "valor",
+    "is_daytrade", "is_minicontrato", "is_futuro_di", "is_opcao", "is_termo",
+]
+
+
+class AlertDeliveryError(RuntimeError):
+    def __init__(self, message: str, entregues: int = 0):
+        super().__init__(message)
+        # Quantos alertas (em ordem) foram confirmados antes da falha
+        self.entregues = entregues
+
+
+class AlertSink:
+    def send(self, alertas: list[dict[str, Any]]) -> None:
+        raise NotImplementedError
+
+
+class JsonlAlertSink(AlertSink):
+    def __init__(self, path: Path):
+        self.path = Path(path)
+
+    def send(self, alertas: list[dict[str, Any]]) -> None:
+        if not alertas:
+            return
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        with self.path.open("a", encoding="utf-8") as f:
+            for a in alertas:
+                f.write(json.dumps(a, ensure_ascii=False) + "\n")
+            f.flush()
+            os.fsync(f.fileno())
+
+
+class HttpAlertSink(AlertSink):
+    def __init__(
+        self,
+        url: str,
+        batch_size: int = 100,
+        max_retries: int = 3,
+        timeout_seconds: float = 5.0,
+        backoff_seconds: float = 0.5,
+    ):
+        self.url = url
+        self.batch_size = max(1, int(batch_size))
+        self.max_retries = max(0, int(max_retries))
+        self.timeout_seconds = timeout_seconds
+        self.backoff_seconds = backoff_seconds
+
+    def _post(self, lote: list[dict[str, Any]]) -> None:
+        body = json.dumps({"alertas": lote}, ensure_ascii=False).encode("utf-8")
+        req = urllib.request.Request(
+            self.url,
+            data=body,
+            method="POST",
+            headers={"Content-Type": "application/json; charset=utf-8"},
+        )
+        with urllib.request.urlopen(req, timeout=self.timeout_seconds) as resp:
+            if not 200 <= resp.status < 300:
+                raise AlertDeliveryError(f"HTTP {resp.status}")
+
+    def send(self, alertas: list[dict[str, Any]]) -> None:
+        for inicio in range(0, len(alertas), self.batch_size):
+            lote = alertas[inicio:inicio + self.batch_size]
+            tentativa = 0
+            while True:
+                try:
+                    self._post(lote)
+                    break
+                except (urllib.error.URLError, OSError, AlertDeliveryError) as e:
+                    if tentativa >= self.max_retries:
+                        raise AlertDeliveryError(
+                            f"Falha ao enviar lote para {self.url}: {e}", entregues=inicio
+                        ) from e
+                    espera = self.backoff_seconds * (2 ** tentativa)
+                    logger.warning(f"Falha ao enviar alertas ({e}); nova tentativa em {espera:.1f}s")
+                    time.sleep(espera)
+                    tentativa += 1
+
+
+def build_alert_sink(cfg) -> AlertSink | None:
+    if cfg.alerts_sink == "jsonl":
+        return JsonlAlertSink(cfg.alerts_jsonl_path.resolve())
+    if cfg.alerts_sink == "http":
+        return HttpAlertSink(
+            url=cfg.alerts_http_url,
+            batch_size=cfg.alerts_batch_size,
+            max_retries=cfg.alerts_max_retries,
+            timeout_seconds=cfg.alerts_timeout_seconds,
+        )
+    return None
+
+
+def flagged_to_alerts(df: pd.DataFrame) -> list[dict[str, Any]]:
+    if df.empty or "flag_alerta" not in df.columns:
+        return []
+
+    sinalizadas = df[df["flag_alerta"].fillna(False).astype(bool)]
+    cols = [c for c in ALERT_COLUMNS if c in sinalizadas.columns]
+    # to_json cuida de NaN/tipos numpy; o round-trip devolve tipos nativos
+    return json.loads(sinalizadas[cols].to_json(orient="records", force_ascii=False))
+
+
+def _load_pending(path: Path) -> list[dict[str, Any]]:
+    if not path.exists():
+        return []
+    pendentes = []
+    with path.open("r", encoding="utf-8") as f:
+        for linha in f:
+            linha = linha.strip()
+            if linha:
+                pendentes.append(json.loads(linha))
+    return pendentes
+
+
+def _save_pending(path: Path, alertas: list[dict[str, Any]]) -> None:
+    if not alertas:
+        path.unlink(missing_ok=True)
+        return
+    path.parent.mkdir(parents=True, exist_ok=True)
+    tmp = path.with_name(f".{path.name}.tmp{os.getpid()}")
+    with tmp.open("w", encoding="utf-8") as f:
+        for a in alertas:
+            f.write(json.dumps(a, ensure_ascii=False) + "\n")
+    os.replace(tmp, path)
+
+
+def pending_lock_path_for(pending_path: Path) -> Path:
+    return pending_path.with_name(f".{pending_path.name}.lock")
+
+
+def emit_alerts(
+    sink: AlertSink,
+    novos_df: pd.DataFrame,
+    pending_path: Path,
+    lock_timeout_seconds: float | None = None,
+) -> int:
+    # Entrega at-least-once: o que não for confirmado fica em `pending_path` e é
+    # reenviado na próxima execução. Consumidores deduplicam por `id_operacao`.
+    # Ingestões concorrentes compartilham a fila: ler/enviar/regravar sob lock.
+    with HistoryLock(
+        pending_lock_path_for(pending_path),
+        timeout_seconds=lock_timeout_seconds,
+        recurso="fila de alertas",
+    ):
+        return _emit_locked(sink, novos_df, pending_path)
+
+
+def _emit_locked(sink: AlertSink, novos_df: pd.DataFrame, pending_path: Path) -> int:
+    alertas = _load_pending(pending_path)
+    vistos = {a.get("id_operacao") for a in alertas}
+    for a in flagged_to_alerts(novos_df):
+        if a.get("id_operacao") not in vistos:
+            vistos.add(a.get("id_operacao"))
+            alertas.append(a)
+
+    if not alertas:
+        return 0
+
+    try:
+        sink.send(alertas)
+    except Exception as e:
+        entregues = getattr(e, "entregues", 0)
+        _save_pending(pending_path, alertas[entregues:])
+        logger.error(f"Alertas não entregues ({len(alertas) - entregues}) mantidos em {pending_path}: {e}")
+        return entregues
+
+    _save_pending(pending_path, [])
+    logger.info(f"Alertas emitidos: {len(alertas)}")
+    return len(alertas)
@@ -5,61 +5,355 @@ from pathlib import Path
 
 import pandas as pd
 
+from .alerts import build_alert_sink, emit_alerts
 from .config import Config
 from .logging_config import setup_logging
 from .excel_store import load_history, backup_if_needed, save_history
-from .pdf_extract import extract_operations_from_pdfs, reorder_columns
+from .journal import (
+    HistoryLock,
+    IdIndexWriter,
+    append_segment,
+    journal_dir_for,
+    list_segments,
+    load_id_index,
+    lock_path_for,
+    read_segments,
+    remove_segments,
+)
+from .partition_store import invalidate_partitions, partition_dir_for, save_partitions
+from .positions import (
+    compute_position_deltas,
+    diff_positions,
+    load_positions,
+    positions_path_for,
+    save_positions,
+    update_positions,
+)
+from .pdf_extract import atualizar_ids_operacao, extract_operations_from_pdfs, reorder_columns
 from .rules import apply_compliance_flags
+from .summary_store import FLAG_COLUMNS, chave_str, summary_path_for, update_summary
 
 logger = logging.getLogger("brokerage_notes_monitor.app")
 
 
-def run(config_path: str, dry_run: bool = False) -> None:
-    cfg = Config.load(config_path)
-    setup_logging(cfg.log_level)
-
+def _extrair(cfg: Config) -> pd.DataFrame:
     pdf_dir = Path(cfg.pdf_input_dir).resolve()
-    excel_path = Path(cfg.excel_output_path).resolve()
-
-    logger.info("Iniciando monitor de notas de corretagem")
     logger.info(f"PDF dir: {pdf_dir}")
-    logger.info(f"Excel: {excel_path} (aba={cfg.excel_sheet_name})")
-    logger.info(f"Dry-run: {dry_run}")
 
     if not pdf_dir.exists():
         raise FileNotFoundError(f"Pasta de PDFs não existe: {pdf_dir}")
 
-    historico_df = load_history(excel_path, cfg.excel_sheet_name)
+    return extract_operations_from_pdfs(
+        pdf_dir,
+        backends=cfg.extraction_backends,
+        discovery=cfg.discovery_options,
+    )
 
-    novos_df = extract_operations_from_pdfs(pdf_dir)
-    if novos_df.empty:
-        logger.info("Nenhuma operação extraída. Encerrando.")
-        return
+
+def _combinar(historico_df: pd.DataFrame, novos_df: pd.DataFrame) -> tuple[pd.DataFrame, pd.DataFrame]:
+    ids_novos = novos_df["id_operacao"].drop_duplicates()
+    if not historico_df.empty and "id_operacao" in historico_df.columns:
+        ids_novos = ids_novos[~ids_novos.isin(historico_df["id_operacao"])]
 
     if historico_df.empty:
-        combinado_df = novos_df
+        combinado_df = novos_df.drop_duplicates(subset=["id_operacao"])
     else:
         combinado_df = pd.concat([historico_df, novos_df], ignore_index=True)
         if "id_operacao" in combinado_df.columns:
             combinado_df.drop_duplicates(subset=["id_operacao"], inplace=True)
 
-    combinado_df = apply_compliance_flags(combinado_df)
-    combinado_df = reorder_columns(combinado_df)
+    # Colunas completas antes das regras: lote só Bovespa não traz as de BM&F
+    combinado_df = apply_compliance_flags(reorder_columns(combinado_df))
+
+    linhas_novas_df = combinado_df[combinado_df["id_operacao"].isin(ids_novos)]
 
     logger.info(f"Total no histórico (pós-dedup): {len(combinado_df)}")
+    logger.info(f"Operações novas nesta execução: {len(linhas_novas_df)}")
+    return combinado_df, linhas_novas_df
+
+
+def _ingerir(cfg: Config) -> Path | None:
+    # Sem lock: várias ingestões podem rodar em paralelo, cada uma no seu segmento
+    novos_df = _extrair(cfg)
+    if novos_df.empty:
+        logger.info("Nenhuma operação extraída.")
+        return None
+
+    excel_path = Path(cfg.excel_output_path).resolve()
+    journal_dir = (cfg.journal_dir or journal_dir_for(excel_path)).resolve()
+
+    # Segmento primeiro: uma falha no caminho dos alertas não perde a ingestão
+    segmento = append_segment(journal_dir, novos_df)
+
+    # Alertas saem na ingestão: nem o lock do histórico nem o Excel ficam no caminho
+    # crítico. Ids já no histórico (índice em texto, sem ler o Excel) não são realertados.
+    sink = build_alert_sink(cfg)
+    if sink is not None:
+        candidatos = novos_df[~novos_df["id_operacao"].isin(load_id_index(journal_dir))]
+        if not candidatos.empty:
+            # Lote só Bovespa (ou só BM&F) não traz todas as colunas que as regras leem
+            candidatos = apply_compliance_flags(reorder_columns(candidatos.copy()))
+        emit_alerts(
+            sink,
+            candidatos,
+            cfg.alerts_pending_path.resolve(),
+            lock_timeout_seconds=cfg.lock_timeout_seconds,
+        )
+
+    return segmento
+
+
+def _compactar(cfg: Config) -> None:
+    excel_path = Path(cfg.excel_output_path).resolve()
+    journal_dir = (cfg.journal_dir or journal_dir_for(excel_path)).resolve()
+
+    with HistoryLock(lock_path_for(excel_path), timeout_seconds=cfg.lock_timeout_seconds):
+        # Só os segmentos listados aqui são consumidos; os que chegarem durante a
+        # compactação ficam para a próxima.
+        segmentos = list_segments(journal_dir)
+        if not segmentos:
+            logger.info("Journal vazio: nada a compactar.")
+            return
+        logger.info(f"Compactando {len(segmentos)} segmento(s) do journal em {excel_path}")
+
+        historico_df = load_history(excel_path, cfg.excel_sheet_name, backup_on_error=True)
+        # Histórico com ids de antes da normalização: migra aqui, senão cada troca
+        # de backend duplicaria as operações já gravadas
+        ids_migrados = atualizar_ids_operacao(historico_df)
+        novos_df = read_segments(segmentos)
+        if novos_df.empty:
+            remove_segments(segmentos)
+            return
+
+        combinado_df, linhas_novas_df = _combinar(historico_df, novos_df)
+
+        if cfg.backup_before_save and excel_path.exists():
+            backup_if_needed(
+                excel_path,
+                keep=cfg.backup_keep,
+                max_age_days=cfg.backup_max_age_days,
+            )
+
+        save_history(
+            df=combinado_df,
+            path=excel_path,
+            sheet_name=cfg.excel_sheet_name,
+            apply_conditional_formatting=True,
+        )
+
+        indice = IdIndexWriter(journal_dir)
+        try:
+            indice.add(combinado_df["id_operacao"])
+            indice.commit()
+        except BaseException:
+            indice.discard()
+            raise
+
+        # Crash antes daqui: os segmentos são relidos e a dedup por id os descarta
+        remove_segments(segmentos)
+
+        if cfg.partition_by:
+            partition_dir = (cfg.partition_dir or partition_dir_for(excel_path)).resolve()
+            try:
+                # Só as partições com linhas novas são regravadas (histórico vazio ou
+                # com ids migrados: todas)
+                save_partitions(
+                    df=combinado_df,
+                    coluna=cfg.partition_by,
+                    out_dir=partition_dir,
+                    sheet_name=cfg.excel_sheet_name,
+                    chaves_afetadas=None if historico_df.empty or ids_migrados else set(chave_str(linhas_novas_df[cfg.partition_by])),
+                    workers=cfg.partition_workers,
+                )
+            except Exception as e:
+                logger.error(f"Erro ao gravar partições ({partition_dir}): {e}")
+                invalidate_partitions(partition_dir)
+
+        if cfg.summary_enabled:
+            summary_path = (cfg.summary_output_path or summary_path_for(excel_path)).resolve()
+            try:
+                # Histórico vazio (novo ou ilegível): o resumo antigo não é mais base válida
+                update_summary(summary_path, linhas_novas_df, combinado_df, rebuild=historico_df.empty)
+            except Exception as e:
+                # Resumo inconsistente é pior que ausente: a próxima execução reconstrói.
+                logger.error(f"Erro ao atualizar resumo ({summary_path}): {e}")
+                summary_path.unlink(missing_ok=True)
+
+        if cfg.positions_enabled:
+            positions_path = (cfg.positions_output_path or positions_path_for(excel_path)).resolve()
+            try:
+                update_positions(
+                    positions_path,
+                    linhas_novas_df,
+                    combinado_df,
+                    cfg.positions_limits,
+                    rebuild=historico_df.empty,
+                )
+            except Exception as e:
+                logger.error(f"Erro ao atualizar posições ({positions_path}): {e}")
+                positions_path.unlink(missing_ok=True)
+
+
+def run(config_path: str, dry_run: bool = False) -> None:
+    cfg = Config.load(config_path)
+    setup_logging(cfg.log_level)
+
+    excel_path = Path(cfg.excel_output_path).resolve()
+
+    logger.info("Iniciando monitor de notas de corretagem")
+    logger.info(f"Excel: {excel_path} (aba={cfg.excel_sheet_name})")
+    logger.info(f"Dry-run: {dry_run}")
 
     if dry_run:
+        # Nada é gravado: nem journal nem Excel
+        novos_df = _extrair(cfg)
+        if novos_df.empty:
+            logger.info("Nenhuma operação extraída. Encerrando.")
+            return
+        historico_df = load_history(excel_path, cfg.excel_sheet_name)
+        atualizar_ids_operacao(historico_df)
+        _combinar(historico_df, novos_df)
         logger.info("Dry-run: não salvou Excel.")
         return
 
-    if cfg.backup_before_save and excel_path.exists():
-        backup_if_needed(excel_path)
+    # run = ingest + compact. Segmentos pendentes de outras ingestões entram junto.
+    _ingerir(cfg)
+    _compactar(cfg)
+    logger.info("OK.")
 
-    save_history(
-        df=combinado_df,
-        path=excel_path,
-        sheet_name=cfg.excel_sheet_name,
-        apply_conditional_formatting=True,
-    )
 
+def ingest(config_path: str) -> None:
+    cfg = Config.load(config_path)
+    setup_logging(cfg.log_level)
+
+    logger.info("Ingestão para o journal (sem gravar o histórico)")
+    _ingerir(cfg)
+
+
+def compact(config_path: str) -> None:
+    cfg = Config.load(config_path)
+    setup_logging(cfg.log_level)
+
+    _compactar(cfg)
     logger.info("OK.")
+
+
+def rebuild_positions(config_path: str, check: bool = False) -> int:
+    # Recalcula as posições do histórico completo e compara com o estado incremental;
+    # com `check`, só relata (não grava)
+    cfg = Config.load(config_path)
+    setup_logging(cfg.log_level)
+
+    excel_path = Path(cfg.excel_output_path).resolve()
+    positions_path = (cfg.positions_output_path or positions_path_for(excel_path)).resolve()
+
+    with HistoryLock(lock_path_for(excel_path), timeout_seconds=cfg.lock_timeout_seconds):
+        # Histórico ilegível aborta: vazio, o estado seria regravado zerado
+        historico_df = load_history(excel_path, cfg.excel_sheet_name, strict=True)
+        esperado = compute_position_deltas(historico_df)
+
+        atual = load_positions(positions_path)
+        divergencias = 0
+        if atual is None:
+            logger.info(f"Sem estado de posições válido em {positions_path}.")
+            divergencias = len(esperado)
+        else:
+            diff = diff_positions(atual, esperado)
+            divergencias = len(diff)
+            if divergencias:
+                logger.warning(f"Posições divergentes do histórico: {divergencias}")
+                print(diff.to_string(index=False))
+            else:
+                logger.info(f"Estado incremental confere com o histórico ({len(esperado)} posições).")
+
+        if check:
+            return divergencias
+
+        save_positions(esperado, positions_path, cfg.positions_limits, linhas_historico=len(historico_df))
+    return divergencias
+
+
+def compare_extraction_backends(config_path: str, backends: list[str]) -> None:
+    cfg = Config.load(config_path)
+    setup_logging(cfg.log_level)
+
+    from .backend_bench import compare_backends
+
+    resultado = compare_backends(Path(cfg.pdf_input_dir).resolve(), backends, discovery=cfg.discovery_options)
+    if resultado.empty:
+        logger.info("Nenhum backend disponível para comparar.")
+        return
+    print(resultado.to_string(index=False))
+
+
+def show_stats(config_path: str) -> None:
+    cfg = Config.load(config_path)
+    setup_logging(cfg.log_level)
+
+    excel_path = Path(cfg.excel_output_path).resolve()
+    df = load_history(excel_path, cfg.excel_sheet_name)
+    if df.empty:
+        print(f"Histórico vazio ou inexistente: {excel_path}")
+        return
+
+    print(f"Histórico: {excel_path}")
+    print(f"Operações: {len(df)}")
+    if "data_pregao" in df.columns:
+        datas = df["data_pregao"].dropna().astype(str)
+        if not datas.empty:
+            print(f"Pregões: {datas.min()} a {datas.max()} ({datas.nunique()} dias)")
+    for col in ("codigo_cliente", "assessor", "arquivo_pdf"):
+        if col in df.columns:
+            print(f"{col}: {df[col].nunique()} distintos")
+
+    for flag in FLAG_COLUMNS + ["flag_alerta"]:
+        if flag in df.columns:
+            print(f"{flag}: {int(df[flag].fillna(False).astype(bool).sum())}")
+
+
+def query_history(
+    config_path: str,
+    cliente: str | None = None,
+    assessor: str | None = None,
+    data_de: str | None = None,
+    data_ate: str | None = None,
+    flag: str | None = None,
+    apenas_sinalizadas: bool = False,
+    output: str | None = None,
+) -> None:
+    cfg = Config.load(config_path)
+    setup_logging(cfg.log_level)
+
+    df = load_history(Path(cfg.excel_output_path).resolve(), cfg.excel_sheet_name)
+    if df.empty:
+        logger.info("Histórico vazio ou inexistente.")
+        return
+
+    mascara = pd.Series(True, index=df.index)
+    if cliente:
+        mascara &= chave_str(df["codigo_cliente"]) == str(cliente)
+    if assessor:
+        mascara &= chave_str(df["assessor"]) == str(assessor)
+    if data_de:
+        mascara &= chave_str(df["data_pregao"]) >= data_de
+    if data_ate:
+        mascara &= chave_str(df["data_pregao"]) <= data_ate
+    if flag:
+        if flag not in df.columns:
+            raise ValueError(f"Flag inexistente no histórico: {flag}")
+        mascara &= df[flag].fillna(False).astype(bool)
+    if apenas_sinalizadas and "flag_alerta" in df.columns:
+        mascara &= df["flag_alerta"].fillna(False).astype(bool)
+
+    resultado = df[mascara]
+    logger.info(f"Operações encontradas: {len(resultado)}")
+
+    if output:
+        out = Path(output)
+        if out.suffix.lower() == ".xlsx":
+            resultado.to_excel(out, index=False, engine="openpyxl")
+        else:
+            resultado.to_csv(out, index=False, encoding="utf-8-sig", sep=";")
+        logger.info(f"Resultado salvo em: {out}")
+    else:
+        print(resultado.to_string(index=False))
@@ -0,0 +1,93 @@
+from __future__ import annotations
+
+import logging
+import time
+from collections import Counter
+from pathlib import Path
+from typing import Iterable
+
+import pandas as pd
+
+from .discovery import PdfSource, iter_pdf_sources
+from .pdf_io import ERROS_ABERTURA
+from .pdf_extract import extrair_operacoes_pagina
+from .text_backends import BACKENDS
+
+logger = logging.getLogger("brokerage_notes_monitor.bench")
+
+
+# Chave de comparação sem `linha_bruta`, que varia com o espaçamento de cada backend
+CHAVE_COMPARACAO = [
+    "layout_origem", "cv", "ativo",
+    "quantidade_str", "preco_str", "valor_str", "dc",
+]
+
+
+def _operacoes_backend(backend, fontes: Iterable[PdfSource]) -> tuple[Counter, int, int, float]:
+    chaves: Counter = Counter()
+    arquivos = 0
+    paginas = 0
+    segundos = 0.0
+
+    for fonte in fontes:
+        arquivos += 1
+        try:
+            with fonte.open() as buf:
+                t0 = time.perf_counter()
+                try:
+                    doc = backend.open(buf.stream)
+                    for indice in range(doc.page_count):
+                        texto = doc.page_text(indice)
+                        paginas += 1
+                        for op in extrair_operacoes_pagina(texto):
+                            chave = (fonte.chave, indice + 1) + tuple(str(op.get(c, "")) for c in CHAVE_COMPARACAO)
+                            chaves[chave] += 1
+                except Exception as e:
+                    logger.warning(f"{backend.name} falhou em {fonte.chave}: {e}")
+                segundos += time.perf_counter() - t0
+        except ERROS_ABERTURA as e:
+            logger.warning(f"Não foi possível abrir o PDF {fonte.chave}: {e!r}")
+
+    return chaves, arquivos, paginas, segundos
+
+
+def compare_backends(pdf_dir: Path, names: list[str], discovery: dict | None = None) -> pd.DataFrame:
+    backends = []
+    for n in names:
+        backend = BACKENDS.get(n.lower())
+        if backend is None:
+            raise ValueError(f"Backend de extração desconhecido: {n}")
+        if not backend.is_available():
+            logger.warning(f"Backend de extração '{n}' não instalado; ignorado.")
+            continue
+        backends.append(backend)
+
+    if not backends:
+        return pd.DataFrame()
+
+    # O primeiro backend da lista é a referência de concordância
+    linhas = []
+    referencia: Counter | None = None
+    for backend in backends:
+        # Descoberta refeita por backend: os zips ficam abertos só durante a passada
+        fontes = iter_pdf_sources(Path(pdf_dir), **(discovery or {}))
+        chaves, arquivos, paginas, segundos = _operacoes_backend(backend, fontes)
+        if referencia is None:
+            referencia = chaves
+
+        comuns = sum((chaves & referencia).values())
+        uniao = sum((chaves | referencia).values())
+        linhas.append({
+            "backend": backend.name,
+            "arquivos": arquivos,
+            "paginas": paginas,
+            "segundos": round(segundos, 3),
+            "paginas_por_s": round(paginas / segundos, 1) if segundos else None,
+            "operacoes": sum(chaves.values()),
+            "em_comum_com_ref": comuns,
+            "so_no_backend": sum((chaves - referencia).values()),
+            "so_na_ref": sum((referencia - chaves).values()),
+            "concordancia": round(comuns / uniao, 4) if uniao else 1.0,
+        })
+
+    return pd.DataFrame(linhas)
@@ -0,0 +1,407 @@
+from __future__ import annotations
+
+import heapq
+import importlib.util
+import json
+import logging
+import os
+import shutil
+import sys
+from pathlib import Path
+from typing import Any, Iterator
+
+import pandas as pd
+
+from .config import Config
+from .excel_store import backup_if_needed, iter_history_chunks, save_history_streaming
+from .logging_config import setup_logging
+from .discovery import iter_pdf_sources
+from .journal import HistoryLock, IdIndexWriter, journal_dir_for, lock_path_for
+from .partition_store import invalidate_partitions, partition_dir_for
+from .pdf_extract import atualizar_ids_operacao, iter_pdf_operations, reorder_columns
+from .positions import compute_position_deltas, merge_positions, positions_path_for, save_positions
+from .rules import apply_compliance_flags
+from .summary_store import compute_flag_aggregates, merge_aggregates, save_summary, summary_path_for
+
+logger = logging.getLogger("brokerage_notes_monitor.backfill")
+
+
+CHECKPOINT_FILE = "checkpoint.json"
+
+# Estimativa inicial até haver dados reais de bytes por linha
+BYTES_POR_LINHA_PADRAO = 4096
+
+
+# =========================================================
+# ================== SPILL EM DISCO (RUNS) ================
+# =========================================================
+
+def _parquet_disponivel() -> bool:
+    return importlib.util.find_spec("pyarrow") is not None
+
+
+def _write_block(df: pd.DataFrame, base: Path) -> None:
+    # Parquet (colunar) quando o pyarrow está instalado; colunas com tipos mistos
+    # (ex.: quantidade int/str) ou ausência do pyarrow caem para pickle.
+    if _parquet_disponivel():
+        try:
+            df.to_parquet(base.with_suffix(".parquet"), index=False)
+            return
+        except Exception:
+            base.with_suffix(".parquet").unlink(missing_ok=True)
+    df.to_pickle(base.with_suffix(".pkl"))
+
+
+def _read_block(path: Path) -> pd.DataFrame:
+    if path.suffix == ".parquet":
+        return pd.read_parquet(path)
+    return pd.read_pickle(path)
+
+
+class SpillStore:
+    # Cada run é um diretório com blocos ordenados por id_operacao. Na fase de merge
+    # só um bloco por run fica em memória (e o número de runs abertos é limitado).
+    def __init__(self, work_dir: Path, block_rows: int):
+        self.work_dir = work_dir
+        self.block_rows = max(1, int(block_rows))
+
+    def write_run(self, df: pd.DataFrame, nome: str) -> None:
+        df = df.copy()
+        df["id_operacao"] = df["id_operacao"].fillna("").astype(str)
+        df = df.drop_duplicates(subset=["id_operacao"], keep="first")
+        df = df.sort_values("id_operacao", kind="stable", ignore_index=True)
+
+        tmp_dir = self._novo_tmp(nome)
+        for i, inicio in enumerate(range(0, len(df), self.block_rows)):
+            _write_block(df.iloc[inicio:inicio + self.block_rows], tmp_dir / f"bloco_{i:05d}")
+        self._publicar(tmp_dir, nome)
+
+    def write_sorted(self, regs: Iterator[dict[str, Any]], nome: str) -> None:
+        # Registros já ordenados e sem duplicatas (saída de um merge): bloco a bloco
+        tmp_dir = self._novo_tmp(nome)
+        bloco: list[dict[str, Any]] = []
+        i = 0
+        for reg in regs:
+            bloco.append(reg)
+            if len(bloco) >= self.block_rows:
+                _write_block(pd.DataFrame(bloco), tmp_dir / f"bloco_{i:05d}")
+                bloco, i = [], i + 1
+        if bloco:
+            _write_block(pd.DataFrame(bloco), tmp_dir / f"bloco_{i:05d}")
+        self._publicar(tmp_dir, nome)
+
+    def _novo_tmp(self, nome: str) -> Path:
+        tmp_dir = self.work_dir / f"{nome}.tmp"
+        shutil.rmtree(tmp_dir, ignore_errors=True)
+        tmp_dir.mkdir(parents=True)
+        return tmp_dir
+
+    def _publicar(self, tmp_dir: Path, nome: str) -> None:
+        # Run só passa a existir completo; um run órfão (crash antes do checkpoint) é descartado
+        destino = self.work_dir / nome
+        shutil.rmtree(destino, ignore_errors=True)
+        os.replace(tmp_dir, destino)
+
+    def iter_run(self, nome: str, ordem: int) -> Iterator[tuple[str, int, dict[str, Any]]]:
+        for bloco in sorted((self.work_dir / nome).iterdir()):
+            df = _read_block(bloco)
+            for reg in df.to_dict("records"):
+                yield reg["id_operacao"], ordem, reg
+
+
+def _mesclar(store: SpillStore, nomes: list[str]) -> Iterator[dict[str, Any]]:
+    # Merge por (id, posição do run): na dedup vence o run que vem antes na lista
+    fontes = [store.iter_run(nome, ordem) for ordem, nome in enumerate(nomes)]
+    ultimo_id = None
+    for id_op, _, reg in heapq.merge(*fontes, key=lambda t: (t[0], t[1])):
+        if id_op == ultimo_id:
+            continue
+        ultimo_id = id_op
+        yield reg
+
+
+# =========================================================
+# ====================== CHECKPOINT =======================
+# =========================================================
+
+def _checkpoint_vazio() -> dict[str, Any]:
+    return {
+        "historico_carregado": False,
+        "historico_identidade": None,
+        "runs_historico": [],
+        "arquivos_concluidos": [],
+        "runs": [],
+        "proximo_run": 0,
+        "colunas": [],
+        "linhas": 0,
+        "bytes": 0,
+        "linhas_historico": 0,
+        "bytes_historico": 0,
+    }
+
+
+def _load_checkpoint(work_dir: Path) -> dict[str, Any]:
+    path = work_dir / CHECKPOINT_FILE
+    if path.exists():
+        with path.open("r", encoding="utf-8") as f:
+            estado = json.load(f)
+        if "runs_historico" in estado:
+            return estado
+        logger.warning("Checkpoint em formato antigo: o backfill recomeça do zero.")
+        for nome in estado.get("runs", []):
+            shutil.rmtree(work_dir / nome, ignore_errors=True)
+    return _checkpoint_vazio()
+
+
+def _save_checkpoint(work_dir: Path, estado: dict[str, Any]) -> None:
+    path = work_dir / CHECKPOINT_FILE
+    tmp = path.with_name(path.name + ".tmp")
+    with tmp.open("w", encoding="utf-8") as f:
+        json.dump(estado, f, ensure_ascii=False)
+    os.replace(tmp, path)
+
+
+def _tamanho_registro(reg: dict[str, Any]) -> int:
+    return sys.getsizeof(reg) + sum(sys.getsizeof(v) for v in reg.values())
+
+
+def _identidade_historico(path: Path) -> dict[str, int] | None:
+    # Basta para notar que outra execução regravou o Excel (save atômico = arquivo novo)
+    if not path.exists():
+        return None
+    st = path.stat()
+    return {"tamanho": st.st_size, "mtime_ns": st.st_mtime_ns}
+
+
+def _spill(
+    store: SpillStore,
+    estado: dict[str, Any],
+    df: pd.DataFrame,
+    bytes_estimados: int,
+    lista: str = "runs",
+) -> None:
+    nome = f"run_{estado['proximo_run']:05d}"
+    store.write_run(df, nome)
+
+    estado["proximo_run"] += 1
+    estado[lista].append(nome)
+    for c in df.columns:
+        if c not in estado["colunas"]:
+            estado["colunas"].append(c)
+    estado["linhas"] += len(df)
+    estado["bytes"] += bytes_estimados
+    if lista == "runs_historico":
+        estado["linhas_historico"] += len(df)
+        estado["bytes_historico"] += bytes_estimados
+    logger.info(f"Spill {nome}: {len(df)} linhas")
+
+
+def _reduzir_runs(store: SpillStore, estado: dict[str, Any], work_dir: Path, fan_in: int) -> None:
+    # Runs consecutivos da mesma lista são mesclados (histórico com histórico,
+    # extração com extração): a prioridade da dedup e a releitura do histórico
+    # alterado continuam valendo. Cada passada percorre a lista em grupos de
+    # `fan_in`, e cada grupo mesclado é registrado no checkpoint.
+    def total() -> int:
+        return len(estado["runs_historico"]) + len(estado["runs"])
+
+    while total() > fan_in:
+        lista = "runs_historico" if len(estado["runs_historico"]) >= len(estado["runs"]) else "runs"
+        i = 0
+        while total() > fan_in and len(estado[lista]) - i >= 2:
+            grupo = estado[lista][i:i + fan_in]
+            nome = f"run_{estado['proximo_run']:05d}"
+            store.write_sorted(_mesclar(store, grupo), nome)
+
+            estado["proximo_run"] += 1
+            estado[lista] = estado[lista][:i] + [nome] + estado[lista][i + len(grupo):]
+            _save_checkpoint(work_dir, estado)
+            for antigo in grupo:
+                shutil.rmtree(work_dir / antigo, ignore_errors=True)
+            logger.info(f"Merge intermediário: {len(grupo)} runs em {nome}")
+            i += 1
+
+
+# =========================================================
+# ======================= BACKFILL ========================
+# =========================================================
+
+def run_backfill(config_path: str, restart: bool = False) -> None:
+    cfg = Config.load(config_path)
+    setup_logging(cfg.log_level)
+
+    excel_path = Path(cfg.excel_output_path).resolve()
+    # Mesmo lock da compactação: um backfill nunca corre junto com outra gravação
+    with HistoryLock(lock_path_for(excel_path), timeout_seconds=cfg.lock_timeout_seconds):
+        _run_backfill(cfg, excel_path, restart)
+
+
+def _run_backfill(cfg: Config, excel_path: Path, restart: bool) -> None:
+    pdf_dir = Path(cfg.pdf_input_dir).resolve()
+    work_dir = (cfg.backfill_work_dir or excel_path.with_name(f".{excel_path.stem}_backfill")).resolve()
+    orcamento = cfg.backfill_memory_budget_bytes
+
+    logger.info("Iniciando backfill")
+    logger.info(f"PDF dir: {pdf_dir}")
+    logger.info(f"Excel: {excel_path} (aba={cfg.excel_sheet_name})")
+    logger.info(f"Orçamento de memória: {orcamento // (1024 * 1024)} MB; área de trabalho: {work_dir}")
+
+    if not pdf_dir.exists():
+        raise FileNotFoundError(f"Pasta de PDFs não existe: {pdf_dir}")
+
+    if restart and work_dir.exists():
+        shutil.rmtree(work_dir)
+    work_dir.mkdir(parents=True, exist_ok=True)
+
+    estado = _load_checkpoint(work_dir)
+    if estado["runs"] or estado["arquivos_concluidos"]:
+        logger.info(
+            f"Retomando backfill: {len(estado['arquivos_concluidos'])} PDFs e "
+            f"{len(estado['runs']) + len(estado['runs_historico'])} runs já gravados"
+        )
+
+    store = SpillStore(work_dir, cfg.backfill_block_rows)
+
+    def bytes_por_linha() -> int:
+        return estado["bytes"] // estado["linhas"] if estado["linhas"] else BYTES_POR_LINHA_PADRAO
+
+    # 1) Histórico existente entra primeiro: na dedup, a primeira ocorrência vence.
+    # Se outra execução gravou no Excel desde o spill, o histórico é relido: o
+    # spill antigo não tem essas linhas e a escrita final as apagaria.
+    identidade = _identidade_historico(excel_path)
+    if estado["historico_carregado"] and estado["historico_identidade"] != identidade:
+        logger.warning("Histórico alterado desde a interrupção do backfill; relendo o histórico.")
+        estado["historico_carregado"] = False
+
+    if not estado["historico_carregado"]:
+        # Carga parcial interrompida ou histórico alterado: runs antigos do histórico
+        # só saem do checkpoint depois que os novos estão gravados.
+        antigos = list(estado["runs_historico"])
+        estado["runs_historico"] = []
+        estado["linhas"] -= estado["linhas_historico"]
+        estado["bytes"] -= estado["bytes_historico"]
+        estado["linhas_historico"] = estado["bytes_historico"] = 0
+        linhas_chunk = max(1000, orcamento // 2 // BYTES_POR_LINHA_PADRAO)
+        for chunk in iter_history_chunks(excel_path, cfg.excel_sheet_name, linhas_chunk):
+            if "id_operacao" not in chunk.columns:
+                raise ValueError(f"Histórico sem coluna id_operacao: {excel_path}")
+            atualizar_ids_operacao(chunk)
+            _spill(store, estado, chunk, int(chunk.memory_usage(deep=True).sum()), lista="runs_historico")
+        estado["historico_carregado"] = True
+        estado["historico_identidade"] = identidade
+        _save_checkpoint(work_dir, estado)
+        for nome in antigos:
+            shutil.rmtree(work_dir / nome, ignore_errors=True)
+
+    # 2) Extração com spill sempre que o buffer atinge metade do orçamento
+    # Descoberta preguiçosa: a extração começa sem listar a árvore inteira
+    concluidos = set(estado["arquivos_concluidos"])
+    pendentes = (
+        f for f in iter_pdf_sources(pdf_dir, **cfg.discovery_options)
+        if f.chave not in concluidos
+    )
+    if concluidos:
+        logger.info(f"PDFs já concluídos em execução anterior: {len(concluidos)}")
+
+    buffer: list[dict[str, Any]] = []
+    arquivos_buffer: list[str] = []
+    bytes_buffer = 0
+
+    def descarregar() -> None:
+        nonlocal buffer, arquivos_buffer, bytes_buffer
+        if buffer:
+            _spill(store, estado, pd.DataFrame(buffer), bytes_buffer)
+        estado["arquivos_concluidos"].extend(arquivos_buffer)
+        _save_checkpoint(work_dir, estado)
+        buffer, arquivos_buffer, bytes_buffer = [], [], 0
+
+    feitos = 0
+    for fonte, regs in iter_pdf_operations(pendentes, backends=cfg.extraction_backends):
+        buffer.extend(regs)
+        arquivos_buffer.append(fonte.chave)
+        bytes_buffer += sum(_tamanho_registro(r) for r in regs)
+        feitos += 1
+        logger.info(f"Progresso: {feitos} PDFs nesta execução ({len(concluidos) + feitos} no total)")
+
+        if bytes_buffer >= orcamento // 2:
+            descarregar()
+    descarregar()
+
+    if not estado["runs"] and not estado["runs_historico"]:
+        logger.info("Nenhuma operação extraída. Encerrando.")
+        shutil.rmtree(work_dir, ignore_errors=True)
+        return
+
+    # 3) Merge em várias passadas enquanto houver mais runs do que cabem abertos
+    # (um bloco de cada) em metade do orçamento; a outra metade é do chunk de saída
+    fan_in = max(2, orcamento // 2 // max(1, store.block_rows * bytes_por_linha()))
+    _reduzir_runs(store, estado, work_dir, fan_in)
+
+    # 4) Merge externo por id_operacao + flags por chunk + escrita em uma passada
+    colunas = list(reorder_columns(pd.DataFrame(columns=estado["colunas"])).columns)
+    linhas_chunk = max(1000, orcamento // 2 // max(1, bytes_por_linha()))
+    resumo = None
+    posicoes = None
+    total_unicas = 0
+
+    def processar(regs: list[dict[str, Any]]) -> pd.DataFrame:
+        nonlocal resumo, posicoes, total_unicas
+        df = reorder_columns(pd.DataFrame(regs))
+        df = reorder_columns(apply_compliance_flags(df))
+        if cfg.summary_enabled:
+            delta = compute_flag_aggregates(df)
+            resumo = delta if resumo is None else merge_aggregates(resumo, delta)
+        if cfg.positions_enabled:
+            delta = compute_position_deltas(df)
+            posicoes = delta if posicoes is None else merge_positions(posicoes, delta)
+        total_unicas += len(df)
+        indice.add(df["id_operacao"])
+        logger.info(f"Gravando: {total_unicas}/{estado['linhas']} linhas (pré-dedup)")
+        return df
+
+    def chunks() -> Iterator[pd.DataFrame]:
+        regs: list[dict[str, Any]] = []
+        for reg in _mesclar(store, estado["runs_historico"] + estado["runs"]):
+            regs.append(reg)
+            if len(regs) >= linhas_chunk:
+                yield processar(regs)
+                regs = []
+        if regs:
+            yield processar(regs)
+
+    if cfg.backup_before_save and excel_path.exists():
+        backup_if_needed(
+            excel_path,
+            keep=cfg.backup_keep,
+            max_age_days=cfg.backup_max_age_days,
+        )
+
+    indice = IdIndexWriter((cfg.journal_dir or journal_dir_for(excel_path)).resolve())
+    try:
+        save_history_streaming(chunks(), colunas, excel_path, cfg.excel_sheet_name)
+        indice.commit()
+    except BaseException:
+        indice.discard()
+        raise
+
+    if cfg.summary_enabled and resumo is not None:
+        save_summary(
+            resumo,
+            (cfg.summary_output_path or summary_path_for(excel_path)).resolve(),
+            linhas_historico=total_unicas,
+        )
+
+    if cfg.positions_enabled and posicoes is not None:
+        save_positions(
+            posicoes,
+            (cfg.positions_output_path or positions_path_for(excel_path)).resolve(),
+            cfg.positions_limits,
+            linhas_historico=total_unicas,
+        )
+
+    if cfg.partition_by:
+        # Regravar partições exigiria o histórico em memória; a próxima execução normal o faz
+        invalidate_partitions((cfg.partition_dir or partition_dir_for(excel_path)).resolve())
+        logger.info("Partições serão regravadas na próxima execução.")
+
+    shutil.rmtree(work_dir, ignore_errors=True)
+    logger.info(f"Backfill concluído: {total_unicas} operações no histórico.")
@@ -10,10 +10,108 @@ class Config:
         self.excel_output_path = Path(raw["paths"]["excel_output_path"])
         self.excel_sheet_name = raw["excel"]["sheet_name"]
 
-        self.backup_before_save = bool(raw.get("processing", {}).get("backup_before_save", True))
+        processing = raw.get("processing", {})
+        self.backup_before_save = bool(processing.get("backup_before_save", True))
+        self.backup_keep = processing.get("backup_keep")
+        self.backup_max_age_days = processing.get("backup_max_age_days")
+
+        discovery = raw.get("discovery", {})
+        self.discovery_recursive = bool(discovery.get("recursive", False))
+        self.discovery_include = list(discovery.get("include", ["*.pdf"]))
+        self.discovery_exclude = list(discovery.get("exclude", []))
+        self.discovery_zip_archives = bool(discovery.get("zip_archives", False))
+
+        backends = raw.get("extraction", {}).get("backends", ["pypdf2"])
+        self.extraction_backends = [backends] if isinstance(backends, str) else list(backends)
+
+        backfill = raw.get("backfill", {})
+        self.backfill_memory_budget_bytes = int(float(backfill.get("memory_budget_mb", 512)) * 1024 * 1024)
+        self.backfill_work_dir = Path(backfill["work_dir"]) if backfill.get("work_dir") else None
+        self.backfill_block_rows = int(backfill.get("block_rows", 5000))
+
+        journal = raw.get("journal", {})
+        self.journal_dir = Path(journal["dir"]) if journal.get("dir") else None
+        lock_timeout = journal.get("lock_timeout_seconds", 600)
+        self.lock_timeout_seconds = float(lock_timeout) if lock_timeout is not None else None
+
+        output = raw.get("output", {})
+        self.partition_by = output.get("partition_by") or None
+        self.partition_dir = Path(output["partition_dir"]) if output.get("partition_dir") else None
+        self.partition_workers = int(output["partition_workers"]) if output.get("partition_workers") else None
+
+        summary = raw.get("summary", {})
+        self.summary_enabled = bool(summary.get("enabled", False))
+        self.summary_output_path = Path(summary["output_path"]) if summary.get("output_path") else None
+
+        positions = raw.get("positions", {})
+        self.positions_enabled = bool(positions.get("enabled", False))
+        self.positions_output_path = Path(positions["output_path"]) if positions.get("output_path") else None
+        self.positions_limits = dict(positions.get("limits", {}))
+
+        alerts = raw.get("alerts", {})
+        self.alerts_sink = str(alerts.get("sink", "none")).lower()
+        self.alerts_jsonl_path = Path(alerts.get("jsonl_path", "data/output/alertas.jsonl"))
+        self.alerts_http_url = alerts.get("http_url", "http://127.0.0.1:8080/alertas")
+        self.alerts_batch_size = int(alerts.get("batch_size", 100))
+        self.alerts_max_retries = int(alerts.get("max_retries", 3))
+        self.alerts_timeout_seconds = float(alerts.get("timeout_seconds", 5))
+        self.alerts_pending_path = Path(alerts.get("pending_path", "data/output/alertas_pendentes.jsonl"))
 
         self.log_level = raw.get("logging", {}).get("level", "INFO")
 
+    @property
+    def discovery_options(self) -> dict:
+        return {
+            "recursive": self.discovery_recursive,
+            "include": self.discovery_include,
+            "exclude": self.discovery_exclude,
+            "zip_archives": self.discovery_zip_archives,
+        }
+
+    def validate(self) -> list[str]:
+        # Só checagens baratas: nada aqui deve importar pandas/openpyxl/PyPDF2
+        from .text_backends import BACKENDS
+
+        problems = []
+
+        if not self.pdf_input_dir.exists():
+            problems.append(f"paths.pdf_input_dir does not exist: {self.pdf_input_dir}")
+        if self.excel_output_path.suffix.lower() != ".xlsx":
+            problems.append(f"paths.excel_output_path must be an .xlsx file: {self.excel_output_path}")
+        if not str(self.excel_sheet_name).strip():
+            problems.append("excel.sheet_name is empty")
+
+        for key, value in (("backup_keep", self.backup_keep), ("backup_max_age_days", self.backup_max_age_days)):
+            if value is not None and (not isinstance(value, (int, float)) or value < 0):
+                problems.append(f"processing.{key} must be a non-negative number: {value}")
+
+        if self.backfill_memory_budget_bytes < 16 * 1024 * 1024:
+            problems.append("backfill.memory_budget_mb must be at least 16")
+
+        for b in self.extraction_backends:
+            if str(b).lower() not in BACKENDS and str(b).lower() != "auto":
+                problems.append(f"Unknown extraction backend: {b}")
+
+        if self.lock_timeout_seconds is not None and self.lock_timeout_seconds < 0:
+            problems.append(f"journal.lock_timeout_seconds must be non-negative: {self.lock_timeout_seconds}")
+
+        if self.partition_by not in (None, "assessor", "codigo_cliente"):
+            problems.append(f"output.partition_by must be assessor or codigo_cliente: {self.partition_by}")
+
+        for contrato, limite in self.positions_limits.items():
+            if not isinstance(limite, (int, float)) or limite < 0:
+                problems.append(f"positions.limits.{contrato} must be a non-negative number: {limite}")
+
+        if self.alerts_sink not in ("none", "jsonl", "http"):
+            problems.append(f"alerts.sink must be none, jsonl or http: {self.alerts_sink}")
+        if self.alerts_sink == "http" and not str(self.alerts_http_url).startswith(("http://", "https://")):
+            problems.append(f"alerts.http_url must be an http(s) URL: {self.alerts_http_url}")
+
+        if self.log_level.upper() not in ("DEBUG", "INFO", "WARNING", "ERROR", "CRITICAL"):
+            problems.append(f"Unknown logging.level: {self.log_level}")
+
+        return problems
+
     @classmethod
     def load(cls, path: str | Path) -> "Config":
         path = Path(path)
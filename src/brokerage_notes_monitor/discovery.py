@@ -0,0 +1,117 @@
+from __future__ import annotations
+
+import logging
+import os
+import zipfile
+from fnmatch import fnmatchcase
+from pathlib import Path
+from typing import Iterator
+
+from .pdf_io import open_pdf_buffer, open_zip_member_buffer
+
+logger = logging.getLogger("brokerage_notes_monitor.discovery")
+
+
+class PdfSource:
+    # Um PDF a processar: arquivo solto ou membro de um .zip (`arquivo` é o zip
+    # aberto uma vez pela descoberta e compartilhado pelos membros)
+    def __init__(self, root: Path, path: Path, membro: str = "", arquivo: zipfile.ZipFile | None = None):
+        self.root = root
+        self.path = path
+        self.membro = membro
+        self.arquivo = arquivo
+
+    @property
+    def nome(self) -> str:
+        return self.membro.rsplit("/", 1)[-1] if self.membro else self.path.name
+
+    @property
+    def caminho_origem(self) -> str:
+        try:
+            return self.path.relative_to(self.root).as_posix()
+        except ValueError:
+            return self.path.as_posix()
+
+    @property
+    def chave(self) -> str:
+        return f"{self.caminho_origem}!{self.membro}" if self.membro else self.caminho_origem
+
+    def open(self):
+        if self.membro:
+            return open_zip_member_buffer(self.path, self.membro, self.arquivo)
+        return open_pdf_buffer(self.path)
+
+    def __repr__(self) -> str:
+        return f"PdfSource({self.chave!r})"
+
+
+def _casa(rel: str, padroes: list[str]) -> bool:
+    rel = rel.lower()
+    return any(fnmatchcase(rel, p.lower()) for p in padroes)
+
+
+def iter_pdf_sources(
+    root: Path,
+    recursive: bool = False,
+    include: list[str] | None = None,
+    exclude: list[str] | None = None,
+    zip_archives: bool = False,
+) -> Iterator[PdfSource]:
+    # Descoberta preguiçosa: cada PDF é entregue assim que encontrado, então árvores
+    # enormes começam a ser processadas sem listagem prévia. Ordem determinística
+    # (entradas ordenadas por diretório). Padrões casam com o caminho relativo em
+    # formato posix; membros de zip aparecem como "pasta/lote.zip/membro.pdf".
+    root = Path(root)
+    include = include or ["*.pdf"]
+    exclude = exclude or []
+
+    def walk(pasta: Path) -> Iterator[PdfSource]:
+        try:
+            with os.scandir(pasta) as it:
+                entradas = sorted(it, key=lambda e: e.name)
+        except OSError as e:
+            logger.warning(f"Não foi possível listar {pasta}: {e}")
+            return
+
+        for entrada in entradas:
+            path = Path(entrada.path)
+            rel = path.relative_to(root).as_posix()
+
+            if entrada.is_dir():
+                if recursive and not _casa(rel, exclude) and not _casa(rel + "/", exclude):
+                    yield from walk(path)
+                continue
+
+            if not entrada.is_file() or _casa(rel, exclude):
+                continue
+
+            sufixo = path.suffix.lower()
+            if sufixo == ".pdf" and _casa(rel, include):
+                yield PdfSource(root, path)
+            elif sufixo == ".zip" and zip_archives:
+                yield from _membros_zip(root, path, rel, include, exclude)
+
+    yield from walk(root)
+
+
+def _membros_zip(
+    root: Path,
+    path: Path,
+    rel: str,
+    include: list[str],
+    exclude: list[str],
+) -> Iterator[PdfSource]:
+    try:
+        zf = zipfile.ZipFile(path)
+    except (OSError, zipfile.BadZipFile) as e:
+        logger.warning(f"Não foi possível ler o zip {rel}: {e}")
+        return
+
+    # Aberto enquanto os membros são consumidos: o diretório central do zip é lido
+    # uma vez por zip, e não a cada membro
+    with zf:
+        membros = [i.filename for i in zf.infolist() if not i.is_dir()]
+        for membro in membros:
+            rel_membro = f"{rel}/{membro}"
+            if membro.lower().endswith(".pdf") and _casa(rel_membro, include) and not _casa(rel_membro, exclude):
+                yield PdfSource(root, path, membro, zf)
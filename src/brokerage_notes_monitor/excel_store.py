@@ -1,44 +1,167 @@
 from __future__ import annotations
 
 import logging
+import os
+import re
+import shutil
 from datetime import datetime
 from pathlib import Path
+from typing import Callable, Iterable, Iterator
 
 import pandas as pd
-from openpyxl import load_workbook
+from openpyxl import Workbook, load_workbook
 from openpyxl.styles import PatternFill
 from openpyxl.formatting.rule import FormulaRule
+from openpyxl.utils import get_column_letter
 
 logger = logging.getLogger("brokerage_notes_monitor.excel")
 
 
-def load_history(path: Path, sheet_name: str) -> pd.DataFrame:
+def load_history(
+    path: Path,
+    sheet_name: str,
+    strict: bool = False,
+    backup_on_error: bool = False,
+) -> pd.DataFrame:
+    # `strict`: histórico existente e ilegível é erro, em vez de virar tabela vazia.
+    # `backup_on_error`: só para quem vai regravar o histórico (comandos de leitura
+    # não criam backups).
     if path.exists():
         try:
             df = pd.read_excel(path, sheet_name=sheet_name, engine="openpyxl")
             logger.info(f"Histórico existente carregado: {len(df)} linhas")
             return df
         except Exception as e:
+            if strict:
+                raise ValueError(f"Histórico existente ilegível ({path}): {e}") from e
             logger.warning(f"Erro ao ler Excel existente: {e}")
-            try:
-                ts = datetime.now().strftime("%Y%m%d_%H%M%S")
-                backup = path.with_name(f"{path.stem}_backup_leitura_falhou_{ts}{path.suffix}")
-                path.rename(backup)
-                logger.warning(f"Arquivo antigo renomeado para backup: {backup}")
-            except Exception as e2:
-                logger.error(f"Não foi possível fazer backup do arquivo antigo: {e2}")
+            if backup_on_error and not _ja_preservado(path, "backup_leitura_falhou"):
+                try:
+                    # O arquivo ilegível fica no lugar até o próximo save atômico substituí-lo
+                    create_backup(path, label="backup_leitura_falhou")
+                except Exception as e2:
+                    logger.error(f"Não foi possível fazer backup do arquivo antigo: {e2}")
             return pd.DataFrame()
     return pd.DataFrame()
 
 
-def backup_if_needed(path: Path) -> None:
+def atomic_write(path: Path, write_fn: Callable[[Path], None]) -> None:
+    # Escreve num temporário no mesmo diretório e troca com os.replace: leitores
+    # (e um crash no meio) só veem o arquivo antigo completo ou o novo completo.
+    path.parent.mkdir(parents=True, exist_ok=True)
+    tmp = path.with_name(f".{path.stem}.tmp{os.getpid()}{path.suffix}")
+    try:
+        write_fn(tmp)
+        with tmp.open("r+b") as f:
+            os.fsync(f.fileno())
+        os.replace(tmp, path)
+    finally:
+        tmp.unlink(missing_ok=True)
+
+
+def _reflink(src: Path, dst: Path) -> bool:
+    try:
+        import fcntl
+    except ImportError:
+        return False
+
+    FICLONE = 0x40049409  # Linux (btrfs, xfs, ...)
+    try:
+        with src.open("rb") as fsrc, dst.open("wb") as fdst:
+            fcntl.ioctl(fdst.fileno(), FICLONE, fsrc.fileno())
+        return True
+    except OSError:
+        dst.unlink(missing_ok=True)
+        return False
+
+
+def _copy_cheap(src: Path, dst: Path) -> str:
+    # Como o save substitui o arquivo (novo inode), um hardlink preserva o conteúdo
+    # antigo sem copiar bytes. Fallbacks: reflink (CoW) e cópia comum.
+    try:
+        os.link(src, dst)
+        return "hardlink"
+    except OSError:
+        pass
+    if _reflink(src, dst):
+        return "reflink"
+    shutil.copy2(src, dst)
+    return "cópia"
+
+
+def _ja_preservado(path: Path, label: str) -> bool:
+    # Mesmo arquivo já guardado com esse rótulo (hardlink: mesmo inode; reflink ou
+    # cópia: mesmo tamanho e mtime), ex.: uma gravação anterior que falhou
+    st = path.stat()
+    for backup in path.parent.glob(f"{path.stem}_{label}_*{path.suffix}"):
+        try:
+            b = backup.stat()
+        except OSError:
+            continue
+        if (b.st_dev, b.st_ino) == (st.st_dev, st.st_ino) or (b.st_size, b.st_mtime_ns) == (st.st_size, st.st_mtime_ns):
+            return True
+    return False
+
+
+def create_backup(path: Path, label: str = "backup") -> Path | None:
     if not path.exists():
-        return
+        return None
 
     ts = datetime.now().strftime("%Y%m%d_%H%M%S")
-    backup = path.with_name(f"{path.stem}_backup_{ts}{path.suffix}")
-    path.rename(backup)
-    logger.info(f"Backup criado: {backup}")
+    backup = path.with_name(f"{path.stem}_{label}_{ts}{path.suffix}")
+    n = 1
+    while backup.exists():
+        backup = path.with_name(f"{path.stem}_{label}_{ts}_{n}{path.suffix}")
+        n += 1
+
+    modo = _copy_cheap(path, backup)
+    logger.info(f"Backup criado ({modo}): {backup}")
+    return backup
+
+
+def prune_backups(
+    path: Path,
+    keep: int | None = None,
+    max_age_days: float | None = None,
+    preservar: Path | None = None,
+) -> None:
+    if keep is None and max_age_days is None:
+        return
+
+    # Só a rotação regular; backups de leitura falha ficam para análise manual.
+    # A idade vem do nome: um hardlink herda o mtime do último save, não a hora do backup.
+    padrao = re.compile(
+        rf"^{re.escape(path.stem)}_backup_(\d{{8}}_\d{{6}})(?:_(\d+))?{re.escape(path.suffix)}$"
+    )
+    backups = []
+    for p in path.parent.iterdir():
+        m = padrao.match(p.name)
+        if m and p.is_file():
+            criado = datetime.strptime(m.group(1), "%Y%m%d_%H%M%S")
+            backups.append((criado, int(m.group(2) or 0), p))
+    backups.sort(key=lambda t: (t[0], t[1]), reverse=True)
+
+    agora = datetime.now()
+    for i, (criado, _, b) in enumerate(backups):
+        if preservar is not None and b == preservar:
+            continue
+        excede_qtd = keep is not None and i >= keep
+        excede_idade = max_age_days is not None and (agora - criado).total_seconds() > max_age_days * 86400
+        if excede_qtd or excede_idade:
+            try:
+                b.unlink()
+                logger.info(f"Backup removido pela retenção: {b}")
+            except OSError as e:
+                logger.warning(f"Não foi possível remover backup {b}: {e}")
+
+
+def backup_if_needed(path: Path, keep: int | None = None, max_age_days: float | None = None) -> None:
+    if not path.exists():
+        return
+
+    # O backup recém-criado nunca é removido pela própria retenção (nem com keep=0)
+    novo = create_backup(path)
+    prune_backups(path, keep=keep, max_age_days=max_age_days, preservar=novo)
 
 
 def save_history(
@@ -47,14 +170,14 @@ def save_history(
     sheet_name: str,
     apply_conditional_formatting: bool = True,
 ) -> None:
-    path.parent.mkdir(parents=True, exist_ok=True)
+    def _write(tmp: Path) -> None:
+        df.to_excel(tmp, sheet_name=sheet_name, index=False, engine="openpyxl")
+        if apply_conditional_formatting:
+            apply_alert_formatting(tmp, sheet_name)
 
-    df.to_excel(path, sheet_name=sheet_name, index=False, engine="openpyxl")
+    atomic_write(path, _write)
     logger.info(f"Histórico salvo em: {path} ({len(df)} linhas)")
 
-    if apply_conditional_formatting:
-        apply_alert_formatting(path, sheet_name)
-
 
 def apply_alert_formatting(path: Path, sheet_name: str, flag_col: str = "flag_alerta_int") -> None:
     wb = load_workbook(path)
@@ -79,12 +202,78 @@ def apply_alert_formatting(path: Path, sheet_name: str, flag_col: str = "flag_al
     end_cell = ws.cell(row=last_row, column=last_col).coordinate
     cell_range = f"{start_cell}:{end_cell}"
 
+    ws.conditional_formatting.add(cell_range, _alert_rule(col_letter))
+    wb.save(path)
+
+    logger.info("Formatação condicional aplicada (flag_alerta_int).")
+
+
+def _alert_rule(col_letter: str) -> FormulaRule:
     formula = f"${col_letter}2=1"
 
     fill = PatternFill(start_color="FFF59D", end_color="FFF59D", fill_type="solid")
-    rule = FormulaRule(formula=[formula], fill=fill, stopIfTrue=False)
+    return FormulaRule(formula=[formula], fill=fill, stopIfTrue=False)
 
-    ws.conditional_formatting.add(cell_range, rule)
-    wb.save(path)
 
-    logger.info("Formatação condicional aplicada (flag_alerta_int).")
+def iter_history_chunks(path: Path, sheet_name: str, chunk_rows: int) -> Iterator[pd.DataFrame]:
+    # Leitura em streaming (read_only): memória proporcional a `chunk_rows`
+    if not path.exists():
+        return
+
+    wb = load_workbook(path, read_only=True)
+    try:
+        ws = wb[sheet_name]
+        linhas = ws.iter_rows(values_only=True)
+        header = next(linhas, None)
+        if header is None:
+            return
+        header = [str(h) if h is not None else f"col_{i}" for i, h in enumerate(header)]
+
+        bloco = []
+        for linha in linhas:
+            if all(v is None for v in linha):
+                continue
+            bloco.append(linha)
+            if len(bloco) >= chunk_rows:
+                yield pd.DataFrame(bloco, columns=header)
+                bloco = []
+        if bloco:
+            yield pd.DataFrame(bloco, columns=header)
+    finally:
+        wb.close()
+
+
+def save_history_streaming(
+    chunks: Iterable[pd.DataFrame],
+    columns: list[str],
+    path: Path,
+    sheet_name: str,
+    flag_col: str = "flag_alerta_int",
+) -> int:
+    # Equivalente ao save_history para históricos que não cabem em memória:
+    # workbook write_only, uma única passada, mesma formatação condicional.
+    total = 0
+
+    def _write(tmp: Path) -> None:
+        nonlocal total
+        wb = Workbook(write_only=True)
+        ws = wb.create_sheet(sheet_name)
+        ws.append(columns)
+
+        for chunk in chunks:
+            chunk = chunk.reindex(columns=columns).astype(object)
+            chunk = chunk.where(chunk.notna(), None)
+            for linha in chunk.itertuples(index=False, name=None):
+                ws.append(list(linha))
+            total += len(chunk)
+
+        if flag_col in columns and total > 0:
+            col_letter = get_column_letter(columns.index(flag_col) + 1)
+            cell_range = f"A2:{get_column_letter(len(columns))}{total + 1}"
+            ws.conditional_formatting.add(cell_range, _alert_rule(col_letter))
+
+        wb.save(tmp)
+
+    atomic_write(path, _write)
+    logger.info(f"Histórico salvo em: {path} ({total} linhas, streaming)")
+    return total
@@ -0,0 +1,207 @@
+from __future__ import annotations
+
+import json
+import logging
+import os
+import time
+import uuid
+from datetime import datetime
+from pathlib import Path
+
+import pandas as pd
+
+logger = logging.getLogger("brokerage_notes_monitor.journal")
+
+
+SEGMENT_PREFIX = "segmento_"
+SEGMENT_SUFFIX = ".jsonl"
+# Ids já consolidados no histórico: a ingestão consulta isto em vez de ler o Excel
+ID_INDEX_FILE = "ids_historico.txt"
+
+
+def journal_dir_for(excel_path: Path) -> Path:
+    return excel_path.with_name(f"{excel_path.stem}_journal")
+
+
+def lock_path_for(excel_path: Path) -> Path:
+    return excel_path.with_name(f".{excel_path.stem}.lock")
+
+
+# =========================================================
+# ========================= LOCK ==========================
+# =========================================================
+
+def _try_lock(fd: int) -> bool:
+    try:
+        if os.name == "nt":
+            import msvcrt
+
+            os.lseek(fd, 0, os.SEEK_SET)
+            msvcrt.locking(fd, msvcrt.LK_NBLCK, 1)
+        else:
+            import fcntl
+
+            fcntl.flock(fd, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        return True
+    except OSError:
+        return False
+
+
+def _unlock(fd: int) -> None:
+    if os.name == "nt":
+        import msvcrt
+
+        os.lseek(fd, 0, os.SEEK_SET)
+        msvcrt.locking(fd, msvcrt.LK_UNLCK, 1)
+    else:
+        import fcntl
+
+        fcntl.flock(fd, fcntl.LOCK_UN)
+
+
+class HistoryLock:
+    # Lock exclusivo entre processos para quem grava o histórico (compactação e
+    # backfill). O SO libera o lock se o processo morrer, então não há lock "preso".
+    # `recurso` só muda as mensagens (o mesmo lock protege a fila de alertas).
+    def __init__(
+        self,
+        path: Path,
+        timeout_seconds: float | None = None,
+        poll_seconds: float = 0.5,
+        recurso: str = "histórico",
+    ):
+        self.path = path
+        self.timeout_seconds = timeout_seconds
+        self.poll_seconds = poll_seconds
+        self.recurso = recurso
+        self._fd: int | None = None
+
+    def acquire(self) -> None:
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        fd = os.open(self.path, os.O_RDWR | os.O_CREAT, 0o644)
+        inicio = time.monotonic()
+        avisou = False
+        while not _try_lock(fd):
+            if self.timeout_seconds is not None and time.monotonic() - inicio >= self.timeout_seconds:
+                os.close(fd)
+                raise TimeoutError(f"{self.recurso.capitalize()} em uso por outro processo ({self.path}): {self._dono()}")
+            if not avisou:
+                logger.info(f"Aguardando lock do {self.recurso} ({self._dono()})...")
+                avisou = True
+            time.sleep(self.poll_seconds)
+
+        # Dono atual registrado só para diagnóstico
+        os.ftruncate(fd, 0)
+        os.lseek(fd, 0, os.SEEK_SET)
+        os.write(fd, f"pid={os.getpid()} desde={datetime.now().isoformat(timespec='seconds')}".encode())
+        os.lseek(fd, 0, os.SEEK_SET)
+        self._fd = fd
+
+    def release(self) -> None:
+        if self._fd is None:
+            return
+        try:
+            _unlock(self._fd)
+        finally:
+            os.close(self._fd)
+            self._fd = None
+
+    def _dono(self) -> str:
+        try:
+            return self.path.read_text(encoding="utf-8").strip() or "dono desconhecido"
+        except OSError:
+            return "dono desconhecido"
+
+    def __enter__(self) -> "HistoryLock":
+        self.acquire()
+        return self
+
+    def __exit__(self, *exc) -> None:
+        self.release()
+
+
+# =========================================================
+# ================ JOURNAL (WRITE-AHEAD) ==================
+# =========================================================
+
+def append_segment(journal_dir: Path, df: pd.DataFrame) -> Path:
+    # Cada ingestão grava um segmento próprio: não há disputa entre processos e o
+    # segmento só aparece completo (tmp + fsync + os.replace).
+    journal_dir.mkdir(parents=True, exist_ok=True)
+    ts = datetime.now().strftime("%Y%m%d_%H%M%S_%f")
+    nome = f"{SEGMENT_PREFIX}{ts}_{os.getpid()}_{uuid.uuid4().hex[:8]}{SEGMENT_SUFFIX}"
+    path = journal_dir / nome
+    tmp = journal_dir / f".{nome}.tmp"
+
+    df = df.astype(object).where(df.notna(), None)
+    with tmp.open("w", encoding="utf-8") as f:
+        for reg in df.to_dict("records"):
+            f.write(json.dumps(reg, ensure_ascii=False, default=str) + "\n")
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp, path)
+
+    logger.info(f"Journal: {len(df)} operações em {path.name}")
+    return path
+
+
+def list_segments(journal_dir: Path) -> list[Path]:
+    if not journal_dir.exists():
+        return []
+    return sorted(
+        p for p in journal_dir.iterdir()
+        if p.is_file() and p.name.startswith(SEGMENT_PREFIX) and p.name.endswith(SEGMENT_SUFFIX)
+    )
+
+
+def read_segments(segments: list[Path]) -> pd.DataFrame:
+    registros = []
+    for seg in segments:
+        with seg.open("r", encoding="utf-8") as f:
+            for linha in f:
+                if linha.strip():
+                    registros.append(json.loads(linha))
+    return pd.DataFrame(registros)
+
+
+def remove_segments(segments: list[Path]) -> None:
+    for seg in segments:
+        seg.unlink(missing_ok=True)
+
+
+# =========================================================
+# ==================== ÍNDICE DE IDS ======================
+# =========================================================
+
+def load_id_index(journal_dir: Path) -> set[str]:
+    path = journal_dir / ID_INDEX_FILE
+    if not path.exists():
+        return set()
+    with path.open("r", encoding="utf-8") as f:
+        return {linha.rstrip("\n") for linha in f if linha.strip()}
+
+
+class IdIndexWriter:
+    # Gravado em blocos (o backfill não tem o histórico inteiro em memória) e
+    # publicado de uma vez com os.replace
+    def __init__(self, journal_dir: Path):
+        journal_dir.mkdir(parents=True, exist_ok=True)
+        self.path = journal_dir / ID_INDEX_FILE
+        self.tmp = journal_dir / f".{ID_INDEX_FILE}.tmp{os.getpid()}"
+        self._f = self.tmp.open("w", encoding="utf-8")
+
+    def add(self, ids) -> None:
+        for i in ids:
+            if i is not None and str(i):
+                self._f.write(f"{i}\n")
+
+    def commit(self) -> None:
+        self._f.flush()
+        os.fsync(self._f.fileno())
+        self._f.close()
+        os.replace(self.tmp, self.path)
+
+    def discard(self) -> None:
+        if not self._f.closed:
+            self._f.close()
+        self.tmp.unlink(missing_ok=True)
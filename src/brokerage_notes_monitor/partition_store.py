@@ -0,0 +1,123 @@
+from __future__ import annotations
+
+import json
+import logging
+import os
+import re
+from concurrent.futures import ProcessPoolExecutor
+from datetime import datetime
+from pathlib import Path
+from typing import Any
+
+import pandas as pd
+
+from .excel_store import save_history
+from .summary_store import chave_str
+
+logger = logging.getLogger("brokerage_notes_monitor.partitions")
+
+
+PARTITION_COLUMNS = ("assessor", "codigo_cliente")
+INDEX_FILE = "index.json"
+
+
+def partition_dir_for(excel_path: Path) -> Path:
+    return excel_path.with_name(f"{excel_path.stem}_particoes")
+
+
+def _nome_arquivo(coluna: str, chave: str) -> str:
+    seguro = re.sub(r"[^\w.-]", "_", chave) if chave else "sem_valor"
+    return f"{coluna}_{seguro}.xlsx"
+
+
+def load_partition_index(out_dir: Path) -> dict[str, Any] | None:
+    path = out_dir / INDEX_FILE
+    if not path.exists():
+        return None
+    try:
+        with path.open("r", encoding="utf-8") as f:
+            return json.load(f)
+    except (OSError, ValueError) as e:
+        logger.warning(f"Índice de partições ilegível ({path}): {e}")
+        return None
+
+
+def _save_partition_index(out_dir: Path, index: dict[str, Any]) -> None:
+    path = out_dir / INDEX_FILE
+    tmp = path.with_name(path.name + ".tmp")
+    with tmp.open("w", encoding="utf-8") as f:
+        json.dump(index, f, ensure_ascii=False, indent=2)
+    os.replace(tmp, path)
+
+
+def invalidate_partitions(out_dir: Path) -> None:
+    # Sem índice, a próxima execução regrava todas as partições
+    (out_dir / INDEX_FILE).unlink(missing_ok=True)
+
+
+def _em_dia(index: dict[str, Any], chave: str, path: Path, linhas: int) -> bool:
+    # Partição sem entrada no índice, com contagem diferente do histórico ou sem
+    # arquivo (crash após o save do histórico, remoção manual) é regravada
+    entrada = index["particoes"].get(chave)
+    return entrada is not None and entrada.get("linhas") == linhas and path.exists()
+
+
+def _write_partition(tarefa: tuple[str, pd.DataFrame, Path, str]) -> tuple[str, str, int]:
+    # Executa em processo separado: precisa ser função de módulo (picklável)
+    chave, df, path, sheet_name = tarefa
+    save_history(df=df, path=path, sheet_name=sheet_name, apply_conditional_formatting=True)
+    return chave, path.name, len(df)
+
+
+def save_partitions(
+    df: pd.DataFrame,
+    coluna: str,
+    out_dir: Path,
+    sheet_name: str,
+    chaves_afetadas: set[str] | None = None,
+    workers: int | None = None,
+) -> None:
+    # `chaves_afetadas=None` (ou índice ausente/de outra coluna) regrava tudo; fora
+    # delas, só partições que não batem com o índice
+    if coluna not in PARTITION_COLUMNS:
+        raise ValueError(f"Coluna de partição inválida: {coluna} (opções: {', '.join(PARTITION_COLUMNS)})")
+
+    out_dir.mkdir(parents=True, exist_ok=True)
+
+    index = load_partition_index(out_dir)
+    if index is None or index.get("coluna") != coluna:
+        index = {"coluna": coluna, "particoes": {}}
+        chaves_afetadas = None
+
+    chaves = chave_str(df[coluna]) if coluna in df.columns else pd.Series("", index=df.index)
+
+    tarefas = []
+    for chave, sub in df.groupby(chaves, sort=True):
+        path = out_dir / _nome_arquivo(coluna, chave)
+        if chaves_afetadas is not None and chave not in chaves_afetadas and _em_dia(index, chave, path, len(sub)):
+            continue
+        tarefas.append((chave, sub, path, sheet_name))
+
+    if not tarefas:
+        logger.info("Nenhuma partição afetada.")
+        return
+
+    workers = workers or os.cpu_count() or 1
+    if workers == 1 or len(tarefas) == 1:
+        for r in map(_write_partition, tarefas):
+            _registrar(index, *r)
+    else:
+        with ProcessPoolExecutor(max_workers=min(workers, len(tarefas))) as ex:
+            for r in ex.map(_write_partition, tarefas):
+                _registrar(index, *r)
+
+    _save_partition_index(out_dir, index)
+    logger.info(f"Partições gravadas por {coluna}: {len(tarefas)} (em {out_dir})")
+
+
+def _registrar(index: dict[str, Any], chave: str, arquivo: str, linhas: int) -> None:
+    index["particoes"][chave] = {
+        "arquivo": arquivo,
+        "linhas": linhas,
+        "atualizado_em": datetime.now().isoformat(timespec="seconds"),
+    }
@@ -4,12 +4,16 @@ from __future__ import annotations
 import hashlib
 import logging
 import re
+import time
 from datetime import datetime
 from pathlib import Path
-from typing import Any
+from typing import Any, Iterable, Iterator
 
 import pandas as pd
-from PyPDF2 import PdfReader
+
+from .discovery import PdfSource, iter_pdf_sources
+from .pdf_io import ERROS_ABERTURA
+from .text_backends import TextBackend, resolve_backends
 
 logger = logging.getLogger("brokerage_notes_monitor.pdf")
 
@@ -20,6 +24,9 @@ logger = logging.getLogger("brokerage_notes_monitor.pdf")
 
 PADRAO_QNEG = re.compile(r"^\d+\-(BOVESPA|BMF)$")
 
+# Sinais de tabela de negócios: página com isso e sem operações foi mal lida
+PADRAO_TABELA_NEGOCIOS = re.compile(r"\d+\-(?:BOVESPA|BMF)\b|(?:^|\s)C/V(?:\s|$)|^\s*Mercadoria\s*$", re.MULTILINE)
+
 # Opções B3: 4 letras + letra do mês + 2-3 dígitos (+ opcional sufixo)
 PADRAO_OPCAO_B3 = re.compile(r"^[A-Z]{4}[A-Z]\d{2,3}[A-Z]?$")
 
@@ -99,6 +106,9 @@ def normalizar_numero_nota(numero_str: str, tamanho: int = 7) -> str:
     return s.zfill(tamanho)
 
 
+CAMPOS_CHAVE_UNICA = 19
+
+
 def gerar_chave_unica(reg: dict) -> str:
     campos = [
         reg.get("arquivo_pdf", ""),
@@ -124,8 +134,31 @@ def gerar_chave_unica(reg: dict) -> str:
     return "|".join(str(c) for c in campos)
 
 
+def normalizar_chave_unica(chave_unica: str) -> str:
+    # O espaçamento do texto muda de backend para backend (e "auto" usa o mais rápido
+    # instalado): o id ignora espaços em todos os campos e, na linha bruta (último
+    # campo), também os " | " com que o layout multilinha junta as partes.
+    *campos, linha = str(chave_unica).split("|", CAMPOS_CHAVE_UNICA - 1)
+    campos = [re.sub(r"\s+", "", c) for c in campos]
+    return "|".join(campos + [re.sub(r"[\s|]+", "", linha)])
+
+
 def gerar_id_operacao(chave_unica: str) -> str:
-    return hashlib.md5(chave_unica.encode("utf-8")).hexdigest()
+    return hashlib.md5(normalizar_chave_unica(chave_unica).encode("utf-8")).hexdigest()
+
+
+def atualizar_ids_operacao(df: pd.DataFrame) -> int:
+    # Histórico gravado com o id antigo (dependente do espaçamento): recalcula a
+    # partir de `chave_unica`. Idempotente; devolve quantos ids mudaram.
+    if df.empty or "chave_unica" not in df.columns or "id_operacao" not in df.columns:
+        return 0
+    com_chave = df["chave_unica"].notna()
+    ids = df.loc[com_chave, "chave_unica"].map(gerar_id_operacao)
+    mudou = ids != df.loc[com_chave, "id_operacao"].astype(str)
+    if mudou.any():
+        df.loc[mudou[mudou].index, "id_operacao"] = ids[mudou]
+        logger.info(f"Ids de operação recalculados no histórico: {int(mudou.sum())}")
+    return int(mudou.sum())
 
 
 def tokens_obs(obs_str: str) -> list:
@@ -502,61 +535,156 @@ def extrair_operacoes_pagina(texto: str):
 # ===================== PIPELINE PDF DIR ==================
 # =========================================================
 
-def extract_operations_from_pdfs(pdf_dir: Path) -> pd.DataFrame:
-    pdf_dir = Path(pdf_dir)
-    arquivos_pdf = [p for p in pdf_dir.iterdir() if p.is_file() and p.suffix.lower() == ".pdf"]
+def _abrir_documentos(pdf_name: str, stream, backends: list[TextBackend]):
+    # Documentos são abertos sob demanda: backends de fallback só custam algo
+    # quando a página realmente precisa deles.
+    docs: dict[str, Any] = {}
 
-    if not arquivos_pdf:
-        logger.info("Nenhum PDF encontrado na pasta de entrada.")
-        return pd.DataFrame()
+    def abrir(backend: TextBackend):
+        if backend.name not in docs:
+            try:
+                docs[backend.name] = backend.open(stream)
+            except Exception as e:
+                logger.warning(f"Não foi possível ler o PDF {pdf_name} ({backend.name}): {e}")
+                docs[backend.name] = None
+        return docs[backend.name]
 
-    registros: list[dict[str, Any]] = []
+    return abrir
 
-    for pdf_path in arquivos_pdf:
-        logger.info(f"Processando: {pdf_path.name}")
 
+def _texto_e_operacoes_pagina(abrir, backends: list[TextBackend], indice: int, pdf_name: str):
+    # Fallback por página: só quando o texto vem vazio ou tem tabela de negócios que
+    # os parsers de layout não entenderam
+    for backend in backends:
+        doc = abrir(backend)
+        if doc is None or indice >= doc.page_count:
+            continue
         try:
-            reader = PdfReader(str(pdf_path))
+            texto = doc.page_text(indice)
         except Exception as e:
-            logger.warning(f"Não foi possível ler o PDF {pdf_path.name}: {e}")
+            logger.warning(f"Erro ao extrair texto (PDF={pdf_name}, pág={indice + 1}, {backend.name}): {e}")
             continue
 
-        for num_pagina, page in enumerate(reader.pages, start=1):
-            try:
-                texto = page.extract_text() or ""
-            except Exception as e:
-                logger.warning(f"Erro ao extrair texto (PDF={pdf_path.name}, pág={num_pagina}): {e}")
-                continue
+        if not texto.strip():
+            continue
 
-            if not texto.strip():
-                continue
+        operacoes = extrair_operacoes_pagina(texto)
+        if operacoes:
+            return texto, operacoes, backend.name
 
-            header = extrair_header_pagina(texto)
-            operacoes = extrair_operacoes_pagina(texto)
+        # Capa/resumo sem tabela de negócios: não há o que buscar nos próximos backends
+        if not PADRAO_TABELA_NEGOCIOS.search(texto):
+            return texto, [], backend.name
 
-            if not operacoes:
-                continue
+    return "", [], ""
 
-            for op in operacoes:
-                reg = {
-                    "arquivo_pdf": pdf_path.name,
-                    "pagina": num_pagina,
-                    "numero_nota": header.get("numero_nota", ""),
-                    "folha": header.get("folha", ""),
-                    "data_pregao": header.get("data_pregao", ""),
-                    "codigo_cliente": header.get("codigo_cliente", ""),
-                    "codigo_cliente_detalhado": header.get("codigo_cliente_detalhado", ""),
-                    "nome_cliente": header.get("nome_cliente", ""),
-                    "cpf_cliente": header.get("cpf_cliente", ""),
-                    "assessor": header.get("assessor", ""),
-                }
-                reg.update(op)
-
-                chave = gerar_chave_unica(reg)
-                reg["chave_unica"] = chave
-                reg["id_operacao"] = gerar_id_operacao(chave)
-
-                registros.append(reg)
+
+def _extrair_registros_pdf(
+    fonte: PdfSource,
+    stream,
+    hash_pdf: str,
+    backends: list[TextBackend],
+) -> list[dict[str, Any]]:
+    registros: list[dict[str, Any]] = []
+
+    abrir = _abrir_documentos(fonte.nome, stream, backends)
+    total_paginas = 0
+    for backend in backends:
+        doc = abrir(backend)
+        if doc is not None:
+            total_paginas = doc.page_count
+            break
+
+    for indice in range(total_paginas):
+        num_pagina = indice + 1
+        texto, operacoes, backend_usado = _texto_e_operacoes_pagina(abrir, backends, indice, fonte.nome)
+
+        if not operacoes:
+            continue
+
+        if backend_usado != backends[0].name:
+            logger.info(f"{fonte.chave} pág={num_pagina}: texto obtido via fallback '{backend_usado}'")
+
+        header = extrair_header_pagina(texto)
+
+        for op in operacoes:
+            reg = {
+                "arquivo_pdf": fonte.nome,
+                "pagina": num_pagina,
+                "numero_nota": header.get("numero_nota", ""),
+                "folha": header.get("folha", ""),
+                "data_pregao": header.get("data_pregao", ""),
+                "codigo_cliente": header.get("codigo_cliente", ""),
+                "codigo_cliente_detalhado": header.get("codigo_cliente_detalhado", ""),
+                "nome_cliente": header.get("nome_cliente", ""),
+                "cpf_cliente": header.get("cpf_cliente", ""),
+                "assessor": header.get("assessor", ""),
+            }
+            reg.update(op)
+
+            chave = gerar_chave_unica(reg)
+            reg["chave_unica"] = chave
+            reg["id_operacao"] = gerar_id_operacao(chave)
+            reg["hash_pdf"] = hash_pdf
+            reg["caminho_origem"] = fonte.caminho_origem
+            reg["membro_zip"] = fonte.membro
+
+            registros.append(reg)
+
+    return registros
+
+
+def iter_pdf_operations(
+    fontes: Iterable[PdfSource],
+    backends: list[str] | None = None,
+) -> Iterator[tuple[PdfSource, list[dict[str, Any]]]]:
+    # Gera (fonte, registros) arquivo a arquivo, sem acumular nada entre PDFs
+    cadeia = resolve_backends(backends)
+    total_bytes = 0
+    total_io = 0.0
+    total_parse = 0.0
+
+    for fonte in fontes:
+        logger.info(f"Processando: {fonte.chave}")
+
+        # Um único buffer (mmap, ou bytes do membro do zip) alimenta o hash e o parsing
+        try:
+            with fonte.open() as buf:
+                t0 = time.perf_counter()
+                regs = _extrair_registros_pdf(fonte, buf.stream, buf.sha256, cadeia)
+                t_parse = time.perf_counter() - t0
+        except ERROS_ABERTURA as e:
+            logger.warning(f"Não foi possível abrir o PDF {fonte.chave}: {e!r}")
+            continue
+
+        total_bytes += buf.size
+        total_io += buf.io_seconds
+        total_parse += t_parse
+        logger.info(
+            f"{fonte.chave}: {buf.size} bytes, I/O {buf.io_seconds:.3f}s, "
+            f"parsing {t_parse:.3f}s, {len(regs)} operações"
+        )
+        yield fonte, regs
+
+    logger.info(f"Leitura de PDFs: {total_bytes} bytes, I/O {total_io:.2f}s, parsing {total_parse:.2f}s")
+
+
+def extract_operations_from_pdfs(
+    pdf_dir: Path,
+    backends: list[str] | None = None,
+    discovery: dict[str, Any] | None = None,
+) -> pd.DataFrame:
+    fontes = iter_pdf_sources(Path(pdf_dir), **(discovery or {}))
+
+    registros: list[dict[str, Any]] = []
+    arquivos = 0
+    for _, regs in iter_pdf_operations(fontes, backends=backends):
+        arquivos += 1
+        registros.extend(regs)
+
+    if not arquivos:
+        logger.info("Nenhum PDF encontrado na pasta de entrada.")
+        return pd.DataFrame()
 
     if not registros:
         return pd.DataFrame()
@@ -573,7 +701,8 @@ def reorder_columns(df: pd.DataFrame) -> pd.DataFrame:
         "codigo_cliente", "codigo_cliente_detalhado",
         "nome_cliente", "cpf_cliente", "assessor",
         "id_operacao", "chave_unica",
-        "layout_origem",
+        "layout_origem", "hash_pdf",
+        "caminho_origem", "membro_zip",
     ]
 
     colunas_operacao_comum = [
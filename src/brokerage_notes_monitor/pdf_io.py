@@ -0,0 +1,79 @@
+from __future__ import annotations
+
+import hashlib
+import io
+import logging
+import mmap
+import time
+import zipfile
+import zlib
+from contextlib import contextmanager
+from pathlib import Path
+from typing import Iterator
+
+logger = logging.getLogger("brokerage_notes_monitor.pdf_io")
+
+
+# Falhas ao abrir/ler um PDF (solto ou membro de zip) que pulam só aquele arquivo
+ERROS_ABERTURA = (
+    OSError, EOFError, KeyError, zipfile.BadZipFile, zlib.error,
+    RuntimeError,  # membro do zip protegido por senha
+    NotImplementedError,  # método de compressão não suportado
+)
+
+
+class PdfBuffer:
+    def __init__(self, stream, size: int, sha256: str, io_seconds: float):
+        # `stream` é o mmap (ou BytesIO para arquivo vazio): serve como arquivo
+        # para o PdfReader e como buffer para o hash, sem cópia.
+        self.stream = stream
+        self.size = size
+        self.sha256 = sha256
+        self.io_seconds = io_seconds
+
+
+@contextmanager
+def open_pdf_buffer(path: Path) -> Iterator[PdfBuffer]:
+    # A extração é sequencial: só um PDF fica mapeado por vez
+    path = Path(path)
+    size = path.stat().st_size
+
+    t0 = time.perf_counter()
+    with path.open("rb") as f:
+        if size == 0:
+            stream = io.BytesIO(b"")
+        else:
+            stream = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+    try:
+        # O hash percorre o arquivo inteiro: é aqui que o I/O real acontece.
+        sha256 = hashlib.sha256(stream if size else b"").hexdigest()
+        yield PdfBuffer(stream, size, sha256, time.perf_counter() - t0)
+    finally:
+        stream.close()
+
+
+@contextmanager
+def open_zip_member_buffer(
+    zip_path: Path,
+    membro: str,
+    arquivo: zipfile.ZipFile | None = None,
+) -> Iterator[PdfBuffer]:
+    # PDF dentro de .zip: descompactado direto para memória (sem arquivo temporário);
+    # os mesmos bytes alimentam o hash e o PdfReader. `arquivo` é o zip já aberto
+    # pela descoberta (um open por zip, não por membro); sem ele, ou já fechado,
+    # o zip é aberto aqui.
+    if arquivo is None or arquivo.fp is None:
+        with zipfile.ZipFile(zip_path) as zf:
+            with open_zip_member_buffer(zip_path, membro, zf) as buf:
+                yield buf
+        return
+
+    info = arquivo.getinfo(membro)
+    t0 = time.perf_counter()
+    data = arquivo.read(info)
+    sha256 = hashlib.sha256(data).hexdigest()
+    stream = io.BytesIO(data)
+    try:
+        yield PdfBuffer(stream, info.file_size, sha256, time.perf_counter() - t0)
+    finally:
+        stream.close()
@@ -0,0 +1,163 @@
+from __future__ import annotations
+
+import logging
+from pathlib import Path
+
+import pandas as pd
+
+from .excel_store import atomic_write
+from .summary_store import SHEET_META, chave_str, watermark_matches, write_watermark
+
+logger = logging.getLogger("brokerage_notes_monitor.positions")
+
+
+CHAVES_POSICAO = ["codigo_cliente", "contrato", "vencimento"]
+QUANTIDADES = ["qtd_compra", "qtd_venda", "posicao_liquida", "qtd_operacoes"]
+COLUNAS_ESTADO = CHAVES_POSICAO + QUANTIDADES + ["ultimo_pregao"]
+
+# Contrato + vencimento opcional (ex.: BM&F "WIN" / "J24"; ticker Bovespa "WINJ24")
+PADRAO_CONTRATO = r"^(WIN|WDO|DI1?)([FGHJKMNQUVXZ]\d{2})?$"
+
+SHEET_POSICOES = "posicoes"
+SHEET_EXCEDENTES = "excedentes"
+
+
+def positions_path_for(excel_path: Path) -> Path:
+    return excel_path.with_name(f"{excel_path.stem}_posicoes{excel_path.suffix}")
+
+
+def _estado_vazio() -> pd.DataFrame:
+    return pd.DataFrame(columns=COLUNAS_ESTADO)
+
+
+def compute_position_deltas(df: pd.DataFrame) -> pd.DataFrame:
+    # Variação de posição por (cliente, contrato, vencimento): +qtd na compra, -qtd na venda
+    if df.empty or "ativo" not in df.columns:
+        return _estado_vazio()
+
+    vazio = pd.Series("", index=df.index)
+    ativo = chave_str(df["ativo"]).str.upper()
+    partes = ativo.str.extract(PADRAO_CONTRATO)
+    mascara = partes[0].notna()
+    if not mascara.any():
+        return _estado_vazio()
+
+    vencimento = chave_str(df.get("bmf_vencimento_codigo", vazio)).str.upper()
+    vencimento = vencimento.where(vencimento != "", partes[1].fillna(""))
+
+    cv = chave_str(df.get("cv", vazio)).str.upper()
+    qtd = pd.to_numeric(df.get("quantidade", vazio), errors="coerce").fillna(0).astype(int)
+
+    base = pd.DataFrame({
+        "codigo_cliente": chave_str(df.get("codigo_cliente", vazio)),
+        "contrato": partes[0],
+        "vencimento": vencimento,
+        "qtd_compra": qtd.where(cv == "C", 0),
+        "qtd_venda": qtd.where(cv == "V", 0),
+        "ultimo_pregao": chave_str(df.get("data_pregao", vazio)),
+    })[mascara.to_numpy()]
+    base["posicao_liquida"] = base["qtd_compra"] - base["qtd_venda"]
+    base["qtd_operacoes"] = 1
+
+    return _agrupar(base)
+
+
+def _agrupar(df: pd.DataFrame) -> pd.DataFrame:
+    return (
+        df.groupby(CHAVES_POSICAO, dropna=False)
+        .agg({**{q: "sum" for q in QUANTIDADES}, "ultimo_pregao": "max"})
+        .reset_index()[COLUNAS_ESTADO]
+    )
+
+
+def merge_positions(base: pd.DataFrame, delta: pd.DataFrame) -> pd.DataFrame:
+    if delta.empty:
+        return base
+    if base.empty:
+        return delta
+    return _agrupar(pd.concat([base, delta], ignore_index=True))
+
+
+def apply_position_limits(estado: pd.DataFrame, limites: dict[str, float]) -> pd.DataFrame:
+    # Limite por prefixo de contrato (o mais longo vence: "DI1" antes de "DI")
+    estado = estado.copy()
+    estado["limite"] = pd.Series(float("nan"), index=estado.index)
+    for prefixo in sorted(limites, key=len):
+        mascara = estado["contrato"].astype(str).str.startswith(prefixo.upper())
+        estado.loc[mascara, "limite"] = float(limites[prefixo])
+    estado["excede_limite"] = estado["limite"].notna() & (estado["posicao_liquida"].abs() > estado["limite"])
+    return estado
+
+
+def load_positions(path: Path, linhas_esperadas: int | None = None) -> pd.DataFrame | None:
+    if not path.exists():
+        return None
+
+    try:
+        folhas = pd.read_excel(path, sheet_name=[SHEET_POSICOES, SHEET_META], engine="openpyxl", dtype=str)
+    except Exception as e:
+        logger.warning(f"Erro ao ler posições existentes: {e}")
+        return None
+    estado = folhas[SHEET_POSICOES]
+
+    faltando = [c for c in COLUNAS_ESTADO if c not in estado.columns]
+    if faltando:
+        logger.warning(f"Posições existentes sem colunas {faltando}; serão reconstruídas.")
+        return None
+
+    if not watermark_matches(folhas[SHEET_META], linhas_esperadas):
+        logger.warning("Posições existentes não correspondem ao histórico; serão reconstruídas.")
+        return None
+
+    for c in CHAVES_POSICAO + ["ultimo_pregao"]:
+        estado[c] = chave_str(estado[c])
+    for c in QUANTIDADES:
+        estado[c] = pd.to_numeric(estado[c], errors="coerce").fillna(0).astype(int)
+    return estado[COLUNAS_ESTADO]
+
+
+def save_positions(estado: pd.DataFrame, path: Path, limites: dict[str, float], linhas_historico: int) -> None:
+    estado = apply_position_limits(estado.sort_values(CHAVES_POSICAO, ignore_index=True), limites)
+
+    def _write(tmp: Path) -> None:
+        with pd.ExcelWriter(tmp, engine="openpyxl") as writer:
+            estado.to_excel(writer, sheet_name=SHEET_POSICOES, index=False)
+            estado[estado["excede_limite"]].to_excel(writer, sheet_name=SHEET_EXCEDENTES, index=False)
+            write_watermark(writer, linhas_historico)
+
+    atomic_write(path, _write)
+
+    logger.info(
+        f"Posições salvas em: {path} ({len(estado)} posições, "
+        f"{int(estado['excede_limite'].sum())} acima do limite)"
+    )
+
+
+def update_positions(
+    path: Path,
+    novos_df: pd.DataFrame,
+    historico_df: pd.DataFrame,
+    limites: dict[str, float],
+    rebuild: bool = False,
+) -> None:
+    # Mesmo contrato do update_summary: `historico_df` já contém as linhas novas e
+    # a marca d'água precisa bater com o histórico anterior a elas
+    estado = None if rebuild else load_positions(path, linhas_esperadas=len(historico_df) - len(novos_df))
+    if estado is None:
+        logger.info("Reconstruindo posições a partir do histórico completo.")
+        estado = compute_position_deltas(historico_df)
+    else:
+        estado = merge_positions(estado, compute_position_deltas(novos_df))
+
+    save_positions(estado, path, limites, linhas_historico=len(historico_df))
+
+
+def diff_positions(atual: pd.DataFrame, esperado: pd.DataFrame) -> pd.DataFrame:
+    # Linhas em que o estado salvo diverge do recalculado (ausentes contam como zero)
+    comparado = atual.merge(esperado, on=CHAVES_POSICAO, how="outer", suffixes=("_salvo", "_recalculado"))
+    divergente = pd.Series(False, index=comparado.index)
+    for q in QUANTIDADES:
+        salvo = comparado[f"{q}_salvo"].fillna(0)
+        recalculado = comparado[f"{q}_recalculado"].fillna(0)
+        divergente |= salvo != recalculado
+    return comparado[divergente]
@@ -0,0 +1,169 @@
+from __future__ import annotations
+
+import logging
+from pathlib import Path
+
+import pandas as pd
+
+from .excel_store import atomic_write
+
+logger = logging.getLogger("brokerage_notes_monitor.summary")
+
+
+FLAG_COLUMNS = ["is_daytrade", "is_minicontrato", "is_futuro_di", "is_opcao", "is_termo"]
+
+# Grão da tabela base: demais visões são derivadas dela (tabela pequena)
+CHAVES_BASE = ["data_pregao", "assessor", "codigo_cliente", "flag"]
+METRICAS = ["qtd_operacoes", "volume"]
+
+SHEET_BASE = "base"
+# Marca d'água: linhas do histórico já refletidas no arquivo derivado
+SHEET_META = "meta"
+VISOES = {
+    "por_cliente": ["codigo_cliente", "flag"],
+    "por_assessor": ["assessor", "flag"],
+    "por_dia": ["data_pregao", "flag"],
+    "por_flag": ["flag"],
+}
+
+
+def summary_path_for(excel_path: Path) -> Path:
+    return excel_path.with_name(f"{excel_path.stem}_resumo{excel_path.suffix}")
+
+
+def chave_str(serie: pd.Series) -> pd.Series:
+    # Códigos lidos do Excel podem vir como float (ex.: "12345.0")
+    s = serie.fillna("").astype(str).str.strip()
+    return s.str.replace(r"\.0$", "", regex=True)
+
+
+def _base_vazia() -> pd.DataFrame:
+    return pd.DataFrame(columns=CHAVES_BASE + METRICAS)
+
+
+def compute_flag_aggregates(df: pd.DataFrame) -> pd.DataFrame:
+    if df.empty:
+        return _base_vazia()
+
+    chaves = pd.DataFrame({
+        "data_pregao": chave_str(df.get("data_pregao", pd.Series("", index=df.index))),
+        "assessor": chave_str(df.get("assessor", pd.Series("", index=df.index))),
+        "codigo_cliente": chave_str(df.get("codigo_cliente", pd.Series("", index=df.index))),
+    })
+    if "valor" in df.columns:
+        chaves["volume"] = pd.to_numeric(df["valor"], errors="coerce").fillna(0.0)
+    else:
+        chaves["volume"] = 0.0
+
+    partes = []
+    for flag in FLAG_COLUMNS:
+        if flag not in df.columns:
+            continue
+        mascara = df[flag].fillna(False).astype(bool)
+        if not mascara.any():
+            continue
+
+        sub = chaves[mascara.to_numpy()]
+        agg = (
+            sub.groupby(CHAVES_BASE[:-1], dropna=False)
+            .agg(qtd_operacoes=("volume", "size"), volume=("volume", "sum"))
+            .reset_index()
+        )
+        agg.insert(len(CHAVES_BASE) - 1, "flag", flag)
+        partes.append(agg)
+
+    if not partes:
+        return _base_vazia()
+
+    return pd.concat(partes, ignore_index=True)[CHAVES_BASE + METRICAS]
+
+
+def merge_aggregates(base: pd.DataFrame, delta: pd.DataFrame) -> pd.DataFrame:
+    if delta.empty:
+        return base
+    if base.empty:
+        return delta
+
+    combinado = pd.concat([base, delta], ignore_index=True)
+    return (
+        combinado.groupby(CHAVES_BASE, dropna=False)[METRICAS]
+        .sum()
+        .reset_index()
+    )
+
+
+def write_watermark(writer: pd.ExcelWriter, linhas_historico: int) -> None:
+    pd.DataFrame({"linhas_historico": [int(linhas_historico)]}).to_excel(writer, sheet_name=SHEET_META, index=False)
+
+
+def watermark_matches(meta: pd.DataFrame, linhas_esperadas: int | None) -> bool:
+    # Sem marca (ou divergente): um crash entre o save do histórico e o do arquivo
+    # derivado deixou linhas de fora; só a reconstrução corrige.
+    if linhas_esperadas is None:
+        return True
+    if "linhas_historico" not in meta.columns or meta.empty:
+        return False
+    linhas = pd.to_numeric(meta["linhas_historico"], errors="coerce").iloc[0]
+    return linhas == linhas_esperadas
+
+
+def load_summary(path: Path, linhas_esperadas: int | None = None) -> pd.DataFrame | None:
+    if not path.exists():
+        return None
+
+    try:
+        folhas = pd.read_excel(path, sheet_name=[SHEET_BASE, SHEET_META], engine="openpyxl", dtype=str)
+    except Exception as e:
+        logger.warning(f"Erro ao ler resumo existente: {e}")
+        return None
+    base = folhas[SHEET_BASE]
+
+    faltando = [c for c in CHAVES_BASE + METRICAS if c not in base.columns]
+    if faltando:
+        logger.warning(f"Resumo existente sem colunas {faltando}; será reconstruído.")
+        return None
+
+    if not watermark_matches(folhas[SHEET_META], linhas_esperadas):
+        logger.warning("Resumo existente não corresponde ao histórico; será reconstruído.")
+        return None
+
+    for c in CHAVES_BASE:
+        base[c] = chave_str(base[c])
+    base["qtd_operacoes"] = pd.to_numeric(base["qtd_operacoes"], errors="coerce").fillna(0).astype(int)
+    base["volume"] = pd.to_numeric(base["volume"], errors="coerce").fillna(0.0)
+    return base[CHAVES_BASE + METRICAS]
+
+
+def save_summary(base: pd.DataFrame, path: Path, linhas_historico: int) -> None:
+    base = base.sort_values(CHAVES_BASE, ignore_index=True)
+
+    def _write(tmp: Path) -> None:
+        with pd.ExcelWriter(tmp, engine="openpyxl") as writer:
+            base.to_excel(writer, sheet_name=SHEET_BASE, index=False)
+            for nome, chaves in VISOES.items():
+                visao = base.groupby(chaves, dropna=False)[METRICAS].sum().reset_index()
+                visao.to_excel(writer, sheet_name=nome, index=False)
+            write_watermark(writer, linhas_historico)
+
+    atomic_write(path, _write)
+
+    logger.info(f"Resumo salvo em: {path} ({len(base)} linhas base)")
+
+
+def update_summary(
+    path: Path,
+    novos_df: pd.DataFrame,
+    historico_df: pd.DataFrame,
+    rebuild: bool = False,
+) -> None:
+    # Incremental: soma só as linhas novas. Sem resumo válido, com `rebuild` ou se a
+    # marca d'água não bate com o histórico anterior às linhas novas, reconstrói a
+    # partir de `historico_df`, que já deve conter as linhas novas.
+    base = None if rebuild else load_summary(path, linhas_esperadas=len(historico_df) - len(novos_df))
+    if base is None:
+        logger.info("Reconstruindo resumo a partir do histórico completo.")
+        base = compute_flag_aggregates(historico_df)
+    else:
+        base = merge_aggregates(base, compute_flag_aggregates(novos_df))
+
+    save_summary(base, path, linhas_historico=len(historico_df))
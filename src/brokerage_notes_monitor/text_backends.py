@@ -0,0 +1,128 @@
+from __future__ import annotations
+
+import importlib.util
+import io
+import logging
+
+logger = logging.getLogger("brokerage_notes_monitor.backends")
+
+
+# Backends opcionais são importados só quando usados; só o PyPDF2 está em requirements.txt.
+
+class TextBackend:
+    name = ""
+    module = ""
+
+    def is_available(self) -> bool:
+        return importlib.util.find_spec(self.module) is not None
+
+    def open(self, stream) -> "BackendDocument":
+        raise NotImplementedError
+
+
+class BackendDocument:
+    page_count = 0
+
+    def page_text(self, index: int) -> str:
+        raise NotImplementedError
+
+
+class _ReaderDocument(BackendDocument):
+    # PyPDF2 e pypdf compartilham a mesma API de PdfReader
+    def __init__(self, reader):
+        self.reader = reader
+        self.page_count = len(reader.pages)
+
+    def page_text(self, index: int) -> str:
+        return self.reader.pages[index].extract_text() or ""
+
+
+class PyPDF2Backend(TextBackend):
+    name = "pypdf2"
+    module = "PyPDF2"
+
+    def open(self, stream) -> BackendDocument:
+        from PyPDF2 import PdfReader
+        return _ReaderDocument(PdfReader(stream))
+
+
+class PypdfBackend(TextBackend):
+    name = "pypdf"
+    module = "pypdf"
+
+    def open(self, stream) -> BackendDocument:
+        from pypdf import PdfReader
+        return _ReaderDocument(PdfReader(stream))
+
+
+class _PyMuPDFDocument(BackendDocument):
+    def __init__(self, doc):
+        self.doc = doc
+        self.page_count = doc.page_count
+
+    def page_text(self, index: int) -> str:
+        return self.doc.load_page(index).get_text() or ""
+
+
+class PyMuPDFBackend(TextBackend):
+    name = "pymupdf"
+    module = "fitz"
+
+    def open(self, stream) -> BackendDocument:
+        import fitz
+        stream.seek(0)
+        return _PyMuPDFDocument(fitz.open(stream=stream.read(), filetype="pdf"))
+
+
+class _PdfminerDocument(BackendDocument):
+    def __init__(self, data: bytes):
+        from pdfminer.pdfpage import PDFPage
+        self.data = data
+        self.page_count = sum(1 for _ in PDFPage.get_pages(io.BytesIO(data)))
+
+    def page_text(self, index: int) -> str:
+        from pdfminer.high_level import extract_text
+        return extract_text(io.BytesIO(self.data), page_numbers=[index]) or ""
+
+
+class PdfminerBackend(TextBackend):
+    name = "pdfminer"
+    module = "pdfminer"
+
+    def open(self, stream) -> BackendDocument:
+        stream.seek(0)
+        return _PdfminerDocument(stream.read())
+
+
+BACKENDS = {
+    b.name: b for b in (PyPDF2Backend(), PypdfBackend(), PyMuPDFBackend(), PdfminerBackend())
+}
+
+# "auto": os mais rápidos instalados primeiro; PyPDF2 sempre presente na cadeia
+AUTO_ORDER = ["pymupdf", "pypdf", "pypdf2", "pdfminer"]
+DEFAULT_BACKENDS = ["pypdf2"]
+
+
+def resolve_backends(names: list[str] | None = None) -> list[TextBackend]:
+    names = [str(n).lower() for n in (names or DEFAULT_BACKENDS)]
+    explicitos = set(names)
+    if "auto" in names:
+        i = names.index("auto")
+        names = names[:i] + AUTO_ORDER + names[i + 1:]
+
+    cadeia: list[TextBackend] = []
+    for n in names:
+        backend = BACKENDS.get(n)
+        if backend is None:
+            raise ValueError(f"Backend de extração desconhecido: {n} (opções: {', '.join(BACKENDS)}, auto)")
+        if backend in cadeia:
+            continue
+        if not backend.is_available():
+            if n in explicitos:
+                logger.warning(f"Backend de extração '{n}' não instalado; ignorado.")
+            continue
+        cadeia.append(backend)
+
+    if not cadeia:
+        cadeia.append(BACKENDS["pypdf2"])
+    return cadeia
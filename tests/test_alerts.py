@@ -0,0 +1,107 @@
+import json
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import pandas as pd
+import pytest
+
+from brokerage_notes_monitor.alerts import HttpAlertSink, emit_alerts
+
+
+class _Servidor:
+    # Endpoint local de alertas: responde com os status de `respostas` (o último
+    # se repete) e guarda os lotes recebidos com 2xx.
+    def __init__(self):
+        self.respostas = [200]
+        self.lotes = []
+        self.requisicoes = 0
+
+        servidor = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_POST(self):
+                corpo = self.rfile.read(int(self.headers["Content-Length"]))
+                status = servidor.respostas[min(servidor.requisicoes, len(servidor.respostas) - 1)]
+                servidor.requisicoes += 1
+                if 200 <= status < 300:
+                    servidor.lotes.append(json.loads(corpo)["alertas"])
+                self.send_response(status)
+                self.send_header("Content-Length", "0")
+                self.end_headers()
+
+            def log_message(self, *args):
+                pass
+
+        self.httpd = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+        self.url = f"http://127.0.0.1:{self.httpd.server_address[1]}/alertas"
+        self.thread = threading.Thread(target=self.httpd.serve_forever, daemon=True)
+        self.thread.start()
+
+    def ids_recebidos(self):
+        return [a["id_operacao"] for lote in self.lotes for a in lote]
+
+    def close(self):
+        self.httpd.shutdown()
+        self.httpd.server_close()
+
+
+@pytest.fixture
+def servidor():
+    s = _Servidor()
+    yield s
+    s.close()
+
+
+def _sinalizadas(n):
+    return pd.DataFrame({
+        "id_operacao": [f"op{i}" for i in range(n)],
+        "ativo": ["WINJ24"] * n,
+        "flag_alerta": [True] * n,
+    })
+
+
+def _sink(servidor, **kwargs):
+    kwargs.setdefault("timeout_seconds", 2)
+    return HttpAlertSink(servidor.url, backoff_seconds=0, **kwargs)
+
+
+def test_envia_em_lotes(servidor, tmp_path):
+    df = pd.concat([_sinalizadas(5), pd.DataFrame({"id_operacao": ["limpa"], "flag_alerta": [False]})])
+
+    entregues = emit_alerts(_sink(servidor, batch_size=2), df, tmp_path / "pendentes.jsonl")
+
+    assert entregues == 5
+    assert [len(lote) for lote in servidor.lotes] == [2, 2, 1]
+    assert servidor.ids_recebidos() == [f"op{i}" for i in range(5)]
+    assert not (tmp_path / "pendentes.jsonl").exists()
+
+
+def test_repete_apos_500(servidor, tmp_path):
+    servidor.respostas = [500, 200]
+
+    entregues = emit_alerts(_sink(servidor, max_retries=2), _sinalizadas(3), tmp_path / "pendentes.jsonl")
+
+    assert entregues == 3
+    assert servidor.requisicoes == 2
+    assert servidor.ids_recebidos() == ["op0", "op1", "op2"]
+
+
+def test_falha_parcial_mantem_pendentes_e_reenvia(servidor, tmp_path):
+    pendentes = tmp_path / "pendentes.jsonl"
+    servidor.respostas = [200, 500]
+
+    entregues = emit_alerts(_sink(servidor, batch_size=2, max_retries=1), _sinalizadas(5), pendentes)
+
+    assert entregues == 2
+    assert servidor.ids_recebidos() == ["op0", "op1"]
+    with pendentes.open(encoding="utf-8") as f:
+        assert [json.loads(linha)["id_operacao"] for linha in f] == ["op2", "op3", "op4"]
+
+    # Próxima execução (sem operações novas) reenvia o que ficou pendente
+    servidor.respostas = [200]
+    servidor.requisicoes = 0
+    entregues = emit_alerts(_sink(servidor, batch_size=2), pd.DataFrame(), pendentes)
+
+    assert entregues == 3
+    assert servidor.ids_recebidos() == ["op0", "op1", "op2", "op3", "op4"]
+    assert not pendentes.exists()
@@ -0,0 +1,114 @@
+import json
+import logging
+from types import SimpleNamespace
+
+import pandas as pd
+import pytest
+
+from brokerage_notes_monitor import backfill
+from brokerage_notes_monitor.excel_store import save_history
+
+
+def _config(tmp_path, **backfill_cfg):
+    raw = {
+        "paths": {"pdf_input_dir": str(tmp_path), "excel_output_path": str(tmp_path / "historico.xlsx")},
+        "excel": {"sheet_name": "operacoes"},
+        "processing": {"backup_before_save": False},
+        # Orçamento minúsculo: um spill por PDF e várias passadas de merge
+        "backfill": {"memory_budget_mb": 0.01, "block_rows": 2, **backfill_cfg},
+    }
+    path = tmp_path / "config.json"
+    path.write_text(json.dumps(raw), encoding="utf-8")
+    return str(path)
+
+
+def _operacao(id_op, arquivo):
+    return {
+        "id_operacao": id_op, "arquivo_pdf": arquivo, "layout_origem": "BOVESPA",
+        "codigo_cliente": "123", "cv": "C", "tipo_mercado": "VISTA", "ativo": "PETR4", "quantidade": 1,
+    }
+
+
+class _Corpus:
+    # Substitui descoberta e extração: cada "PDF" devolve as operações dadas
+    def __init__(self, arquivos, falhar_apos=None):
+        self.arquivos = arquivos
+        self.falhar_apos = falhar_apos
+        self.extraidos = []
+
+    def fontes(self, pdf_dir, **kwargs):
+        for nome in self.arquivos:
+            yield SimpleNamespace(chave=nome)
+
+    def operacoes(self, fontes, **kwargs):
+        for fonte in fontes:
+            if self.falhar_apos is not None and len(self.extraidos) >= self.falhar_apos:
+                raise KeyboardInterrupt
+            self.extraidos.append(fonte.chave)
+            yield fonte, [_operacao(i, fonte.chave) for i in self.arquivos[fonte.chave]]
+
+
+def _usar(monkeypatch, corpus):
+    monkeypatch.setattr(backfill, "iter_pdf_sources", corpus.fontes)
+    monkeypatch.setattr(backfill, "iter_pdf_operations", corpus.operacoes)
+
+
+def _ids_historico(tmp_path):
+    df = pd.read_excel(tmp_path / "historico.xlsx", sheet_name="operacoes", engine="openpyxl")
+    return df["id_operacao"].tolist()
+
+
+ARQUIVOS = {f"nota_{n}.pdf": [f"{n}{i:02d}" for i in range(5)] + ["repetida"] for n in range(8)}
+
+
+def test_merge_em_varias_passadas_mantem_dedup(tmp_path, monkeypatch, caplog):
+    caplog.set_level(logging.INFO, logger="brokerage_notes_monitor.backfill")
+    _usar(monkeypatch, _Corpus(ARQUIVOS))
+    save_history(pd.DataFrame([_operacao("repetida", "historico.pdf")]), tmp_path / "historico.xlsx", "operacoes")
+
+    backfill.run_backfill(_config(tmp_path))
+
+    assert "Merge intermediário" in caplog.text
+    ids = _ids_historico(tmp_path)
+    assert ids == sorted({i for regs in ARQUIVOS.values() for i in regs})
+    # A versão do histórico vence a extraída
+    df = pd.read_excel(tmp_path / "historico.xlsx", sheet_name="operacoes", engine="openpyxl")
+    assert df.loc[df["id_operacao"] == "repetida", "arquivo_pdf"].tolist() == ["historico.pdf"]
+
+
+def test_retoma_apos_interrupcao_sem_reextrair(tmp_path, monkeypatch):
+    config = _config(tmp_path)
+    _usar(monkeypatch, _Corpus(ARQUIVOS, falhar_apos=3))
+    with pytest.raises(KeyboardInterrupt):
+        backfill.run_backfill(config)
+    checkpoint = json.loads((tmp_path / ".historico_backfill" / "checkpoint.json").read_text(encoding="utf-8"))
+    assert checkpoint["arquivos_concluidos"]
+
+    corpus = _Corpus(ARQUIVOS)
+    _usar(monkeypatch, corpus)
+    backfill.run_backfill(config)
+
+    assert corpus.extraidos == [a for a in ARQUIVOS if a not in checkpoint["arquivos_concluidos"]]
+    assert _ids_historico(tmp_path) == sorted({i for regs in ARQUIVOS.values() for i in regs})
+    assert not (tmp_path / ".historico_backfill").exists()
+
+
+def test_reler_historico_alterado_durante_interrupcao(tmp_path, monkeypatch):
+    config = _config(tmp_path)
+    save_history(pd.DataFrame([_operacao("antiga", "historico.pdf")]), tmp_path / "historico.xlsx", "operacoes")
+    _usar(monkeypatch, _Corpus(ARQUIVOS, falhar_apos=2))
+    with pytest.raises(KeyboardInterrupt):
+        backfill.run_backfill(config)
+
+    # Outra execução gravou no histórico enquanto o backfill estava parado
+    save_history(
+        pd.DataFrame([_operacao("antiga", "historico.pdf"), _operacao("compactada", "outra.pdf")]),
+        tmp_path / "historico.xlsx",
+        "operacoes",
+    )
+    _usar(monkeypatch, _Corpus(ARQUIVOS))
+    backfill.run_backfill(config)
+
+    ids = _ids_historico(tmp_path)
+    assert "antiga" in ids and "compactada" in ids
+    assert len(ids) == len(set(ids)) == len({i for regs in ARQUIVOS.values() for i in regs}) + 2
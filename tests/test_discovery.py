@@ -0,0 +1,42 @@
+import zipfile
+
+from brokerage_notes_monitor.backend_bench import compare_backends
+from brokerage_notes_monitor.discovery import iter_pdf_sources
+
+
+def _zip(path, membros):
+    with zipfile.ZipFile(path, "w", compression=zipfile.ZIP_STORED) as zf:
+        for nome, dados in membros.items():
+            zf.writestr(nome, dados)
+
+
+def test_zip_aberto_uma_vez_por_varredura(tmp_path, monkeypatch):
+    _zip(tmp_path / "lote.zip", {f"nota_{i:03d}.pdf": b"%PDF-1.4" for i in range(50)})
+    aberturas = []
+    original = zipfile.ZipFile.__init__
+
+    def _contar(self, *args, **kwargs):
+        aberturas.append(args[0])
+        original(self, *args, **kwargs)
+
+    monkeypatch.setattr(zipfile.ZipFile, "__init__", _contar)
+
+    lidos = 0
+    for fonte in iter_pdf_sources(tmp_path, zip_archives=True):
+        with fonte.open() as buf:
+            lidos += buf.size > 0
+
+    assert lidos == 50
+    assert len(aberturas) == 1
+
+
+def test_compare_backends_pula_membro_ilegivel(tmp_path):
+    marcador = b"CORROMPIDO" * 20
+    _zip(tmp_path / "lote.zip", {"a.pdf": b"%PDF-1.4 nada", "b.pdf": marcador})
+    # CRC do membro deixa de bater: a leitura falha com BadZipFile
+    dados = (tmp_path / "lote.zip").read_bytes()
+    (tmp_path / "lote.zip").write_bytes(dados.replace(marcador, marcador[:-1] + b"!"))
+
+    df = compare_backends(tmp_path, ["pypdf2"], {"zip_archives": True})
+
+    assert df["arquivos"].tolist() == [2]
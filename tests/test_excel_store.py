@@ -0,0 +1,30 @@
+from brokerage_notes_monitor.excel_store import load_history
+
+
+def _backups(tmp_path):
+    return sorted(p.name for p in tmp_path.glob("historico_backup_leitura_falhou_*"))
+
+
+def test_leitura_sem_backup_em_historico_ilegivel(tmp_path):
+    path = tmp_path / "historico.xlsx"
+    path.write_bytes(b"nao e um xlsx")
+
+    for _ in range(3):
+        assert load_history(path, "operacoes").empty
+
+    assert _backups(tmp_path) == []
+
+
+def test_backup_de_falha_uma_vez_por_arquivo(tmp_path):
+    path = tmp_path / "historico.xlsx"
+    path.write_bytes(b"nao e um xlsx")
+
+    for _ in range(3):
+        assert load_history(path, "operacoes", backup_on_error=True).empty
+    assert len(_backups(tmp_path)) == 1
+
+    # Outro arquivo ilegível no lugar (novo inode): novo backup
+    path.unlink()
+    path.write_bytes(b"outro conteudo ilegivel")
+    load_history(path, "operacoes", backup_on_error=True)
+    assert len(_backups(tmp_path)) == 2
@@ -0,0 +1,48 @@
+import hashlib
+
+import pandas as pd
+
+from brokerage_notes_monitor.pdf_extract import (
+    atualizar_ids_operacao,
+    extrair_operacoes_pagina_bovespa,
+    gerar_chave_unica,
+    gerar_id_operacao,
+)
+
+CABECALHO = {
+    "arquivo_pdf": "nota.pdf", "pagina": 1, "numero_nota": "0001234", "folha": "1",
+    "data_pregao": "02/01/2024", "codigo_cliente": "123", "nome_cliente": "JOAO DA SILVA",
+    "cpf_cliente": "", "assessor": "A1",
+}
+
+
+def _id(op, **cabecalho):
+    return gerar_id_operacao(gerar_chave_unica({**CABECALHO, **cabecalho, **op}))
+
+
+def test_mesmo_id_para_linha_achatada_e_multilinha():
+    # Um backend devolve a linha inteira, outro quebra cada campo numa linha
+    achatada = "1-BOVESPA C VISTA ITAUUNIBANCO  PN   D 100 32,10 3.210,00 D"
+    multilinha = "\n".join(["1-BOVESPA", "C", "VISTA", "ITAUUNIBANCO PN", "D", "100", "32,10", "3.210,00", "D"])
+
+    [a] = extrair_operacoes_pagina_bovespa(achatada)
+    [b] = extrair_operacoes_pagina_bovespa(multilinha)
+
+    assert a["linha_bruta"] != b["linha_bruta"]
+    assert _id(a) == _id(b, nome_cliente="JOAO  DA SILVA")
+
+
+def test_campos_distintos_continuam_distintos():
+    [op] = extrair_operacoes_pagina_bovespa("1-BOVESPA C VISTA PETR4 100 32,10 3.210,00 D")
+    assert _id(op) != _id({**op, "cv": "V"})
+    assert _id(op) != _id(op, pagina=11, folha="")
+
+
+def test_migra_ids_antigos_do_historico():
+    chave = gerar_chave_unica({**CABECALHO, "ativo": "PETR4", "linha_bruta": "1-BOVESPA | C | VISTA"})
+    antigo = hashlib.md5(chave.encode("utf-8")).hexdigest()
+    df = pd.DataFrame({"chave_unica": [chave, None], "id_operacao": [antigo, "sem-chave"]})
+
+    assert atualizar_ids_operacao(df) == 1
+    assert df["id_operacao"].tolist() == [gerar_id_operacao(chave), "sem-chave"]
+    assert atualizar_ids_operacao(df) == 0
@@ -0,0 +1,196 @@
+import hashlib
+import json
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import pandas as pd
+import pytest
+
+from brokerage_notes_monitor import app
+from brokerage_notes_monitor.alerts import AlertDeliveryError, AlertSink, emit_alerts
+from brokerage_notes_monitor.config import Config
+from brokerage_notes_monitor.journal import (
+    HistoryLock,
+    append_segment,
+    journal_dir_for,
+    list_segments,
+    load_id_index,
+    read_segments,
+)
+from brokerage_notes_monitor.pdf_extract import gerar_chave_unica, gerar_id_operacao
+
+
+def _config(tmp_path, **alerts):
+    raw = {
+        "paths": {"pdf_input_dir": str(tmp_path), "excel_output_path": str(tmp_path / "historico.xlsx")},
+        "excel": {"sheet_name": "operacoes"},
+        "processing": {"backup_before_save": False},
+        "journal": {"lock_timeout_seconds": 5},
+    }
+    if alerts:
+        raw["alerts"] = alerts
+    return Config(raw)
+
+
+def _operacoes(ids, layout="BOVESPA"):
+    return pd.DataFrame({
+        "id_operacao": ids,
+        "arquivo_pdf": ["nota.pdf"] * len(ids),
+        "layout_origem": [layout] * len(ids),
+        "codigo_cliente": ["123"] * len(ids),
+        "cv": ["C"] * len(ids),
+        "tipo_mercado": ["VISTA"] * len(ids),
+        "ativo": ["WINJ24"] * len(ids),
+        "quantidade": [1] * len(ids),
+    })
+
+
+def _historico(cfg):
+    return pd.read_excel(cfg.excel_output_path, sheet_name=cfg.excel_sheet_name, engine="openpyxl")
+
+
+class _Coletor(AlertSink):
+    def __init__(self, falha=False):
+        self.falha = falha
+        self.recebidos = []
+
+    def send(self, alertas):
+        # Janela larga entre ler e regravar a fila, para expor corrida sem lock
+        time.sleep(0.05)
+        if self.falha:
+            raise AlertDeliveryError("indisponível")
+        self.recebidos.extend(a["id_operacao"] for a in alertas)
+
+
+def test_ingestao_so_bovespa_grava_segmento_e_alerta(tmp_path, monkeypatch):
+    # Lote sem colunas BM&F (ex.: bmf_tipo_negocio) não pode quebrar as regras
+    cfg = _config(tmp_path, sink="jsonl", jsonl_path=str(tmp_path / "alertas.jsonl"),
+                  pending_path=str(tmp_path / "pendentes.jsonl"))
+    monkeypatch.setattr(app, "_extrair", lambda cfg: _operacoes(["a", "b"]))
+
+    segmento = app._ingerir(cfg)
+
+    assert segmento is not None and segmento.exists()
+    with (tmp_path / "alertas.jsonl").open(encoding="utf-8") as f:
+        assert sorted(json.loads(linha)["id_operacao"] for linha in f) == ["a", "b"]
+
+
+def test_segmento_gravado_mesmo_se_alerta_falhar(tmp_path, monkeypatch):
+    cfg = _config(tmp_path, sink="jsonl", pending_path=str(tmp_path / "pendentes.jsonl"))
+    monkeypatch.setattr(app, "_extrair", lambda cfg: _operacoes(["a"]))
+    monkeypatch.setattr(app, "emit_alerts", lambda *a, **k: (_ for _ in ()).throw(OSError("disco")))
+
+    with pytest.raises(OSError):
+        app._ingerir(cfg)
+
+    assert len(list_segments(journal_dir_for(cfg.excel_output_path.resolve()))) == 1
+
+
+def test_ingestoes_concorrentes_nao_perdem_segmentos(tmp_path):
+    journal_dir = tmp_path / "journal"
+    lotes = [_operacoes([f"p{n}_{i}" for i in range(20)]) for n in range(8)]
+
+    with ThreadPoolExecutor(max_workers=8) as pool:
+        list(pool.map(lambda df: append_segment(journal_dir, df), lotes))
+
+    segmentos = list_segments(journal_dir)
+    assert len(segmentos) == 8
+    assert len(read_segments(segmentos)) == 160
+
+
+def test_alertas_concorrentes_nao_perdem_pendentes(tmp_path):
+    pendentes = tmp_path / "pendentes.jsonl"
+    sinks = [_Coletor(falha=n % 2 == 0) for n in range(6)]
+    lotes = [_operacoes([f"p{n}_{i}" for i in range(3)]).assign(flag_alerta=True) for n in range(6)]
+
+    with ThreadPoolExecutor(max_workers=6) as pool:
+        list(pool.map(lambda par: emit_alerts(par[0], par[1], pendentes, lock_timeout_seconds=5), zip(sinks, lotes)))
+
+    entregues = {i for s in sinks for i in s.recebidos}
+    na_fila = set()
+    if pendentes.exists():
+        with pendentes.open(encoding="utf-8") as f:
+            na_fila = {json.loads(linha)["id_operacao"] for linha in f}
+    todos = {i for df in lotes for i in df["id_operacao"]}
+    assert entregues | na_fila == todos
+
+
+def test_compactacao_deduplica_segmentos(tmp_path):
+    cfg = _config(tmp_path)
+    journal_dir = journal_dir_for(cfg.excel_output_path.resolve())
+    append_segment(journal_dir, _operacoes(["a", "b"]))
+    append_segment(journal_dir, _operacoes(["b", "c"]))
+
+    app._compactar(cfg)
+    append_segment(journal_dir, _operacoes(["a", "c", "d"]))
+    app._compactar(cfg)
+
+    assert sorted(_historico(cfg)["id_operacao"]) == ["a", "b", "c", "d"]
+    assert load_id_index(journal_dir) == {"a", "b", "c", "d"}
+    assert list_segments(journal_dir) == []
+
+
+def test_compactacao_migra_ids_antigos_sem_duplicar(tmp_path):
+    cfg = _config(tmp_path)
+    journal_dir = journal_dir_for(cfg.excel_output_path.resolve())
+    linhas = ["1-BOVESPA C VISTA PETR4 100 32,10 3.210,00 D", "1-BOVESPA V VISTA VALE3 10 60,00 600,00 C"]
+    chaves = [gerar_chave_unica({"arquivo_pdf": "nota.pdf", "linha_bruta": l}) for l in linhas]
+    antigos = [hashlib.md5(c.encode("utf-8")).hexdigest() for c in chaves]
+    append_segment(journal_dir, _operacoes(antigos).assign(chave_unica=chaves))
+    app._compactar(cfg)
+
+    # Mesmas operações, extraídas por um backend que quebra a linha em campos
+    chaves_multilinha = [
+        gerar_chave_unica({"arquivo_pdf": "nota.pdf", "linha_bruta": l.replace(" ", " | ")}) for l in linhas
+    ]
+    append_segment(journal_dir, _operacoes(
+        [gerar_id_operacao(c) for c in chaves_multilinha]
+    ).assign(chave_unica=chaves_multilinha))
+    app._compactar(cfg)
+
+    assert sorted(_historico(cfg)["id_operacao"]) == sorted(gerar_id_operacao(c) for c in chaves)
+
+
+def test_crash_antes_de_remover_segmentos_nao_duplica(tmp_path, monkeypatch):
+    cfg = _config(tmp_path)
+    journal_dir = journal_dir_for(cfg.excel_output_path.resolve())
+    append_segment(journal_dir, _operacoes(["a", "b"]))
+
+    def _crash(segmentos):
+        raise KeyboardInterrupt
+
+    monkeypatch.setattr(app, "remove_segments", _crash)
+    with pytest.raises(KeyboardInterrupt):
+        app._compactar(cfg)
+    monkeypatch.undo()
+
+    # Segmento continua lá e é relido: a dedup por id o descarta
+    assert len(list_segments(journal_dir)) == 1
+    app._compactar(cfg)
+
+    assert sorted(_historico(cfg)["id_operacao"]) == ["a", "b"]
+    assert list_segments(journal_dir) == []
+
+
+def test_lock_ocupado_estoura_timeout(tmp_path):
+    lock = tmp_path / ".historico.lock"
+    segurando = threading.Event()
+    liberar = threading.Event()
+
+    def _dono():
+        with HistoryLock(lock):
+            segurando.set()
+            liberar.wait(5)
+
+    t = threading.Thread(target=_dono)
+    t.start()
+    try:
+        segurando.wait(5)
+        inicio = time.monotonic()
+        with pytest.raises(TimeoutError, match="em uso por outro processo"):
+            HistoryLock(lock, timeout_seconds=0.3, poll_seconds=0.05).acquire()
+        assert time.monotonic() - inicio < 2
+    finally:
+        liberar.set()
+        t.join()
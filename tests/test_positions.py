@@ -0,0 +1,54 @@
+import json
+
+import pandas as pd
+import pytest
+
+from brokerage_notes_monitor.app import rebuild_positions
+from brokerage_notes_monitor.excel_store import save_history
+from brokerage_notes_monitor.positions import load_positions, positions_path_for
+
+
+def _config(tmp_path):
+    raw = {
+        "paths": {"pdf_input_dir": str(tmp_path), "excel_output_path": str(tmp_path / "historico.xlsx")},
+        "excel": {"sheet_name": "operacoes"},
+        "positions": {"enabled": True, "limits": {"WIN": 10}},
+    }
+    path = tmp_path / "config.json"
+    path.write_text(json.dumps(raw), encoding="utf-8")
+    return str(path)
+
+
+def _historico(tmp_path):
+    df = pd.DataFrame({
+        "id_operacao": ["a", "b"], "codigo_cliente": ["123", "123"], "cv": ["C", "V"],
+        "ativo": ["WINJ24", "WINJ24"], "quantidade": [5, 2], "data_pregao": ["02/01/2024"] * 2,
+    })
+    save_history(df, tmp_path / "historico.xlsx", "operacoes")
+
+
+def test_rebuild_grava_estado_do_historico(tmp_path):
+    config = _config(tmp_path)
+    _historico(tmp_path)
+
+    assert rebuild_positions(config, check=True) == 1
+    assert not positions_path_for(tmp_path / "historico.xlsx").exists()
+
+    rebuild_positions(config)
+    estado = load_positions(positions_path_for(tmp_path / "historico.xlsx"), linhas_esperadas=2)
+    assert estado["posicao_liquida"].tolist() == [3]
+    assert rebuild_positions(config, check=True) == 0
+
+
+def test_rebuild_aborta_com_historico_ilegivel(tmp_path):
+    config = _config(tmp_path)
+    _historico(tmp_path)
+    rebuild_positions(config)
+    posicoes = positions_path_for(tmp_path / "historico.xlsx")
+    antes = posicoes.read_bytes()
+
+    (tmp_path / "historico.xlsx").write_bytes(b"nao e um xlsx")
+
+    with pytest.raises(ValueError, match="ilegível"):
+        rebuild_positions(config)
+    assert posicoes.read_bytes() == antes
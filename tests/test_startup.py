@@ -0,0 +1,70 @@
+import json
+import subprocess
+import sys
+import time
+from pathlib import Path
+
+import pytest
+
+MAIN = Path(__file__).resolve().parent.parent / "main.py"
+
+PESADOS = ("pandas", "openpyxl", "PyPDF2")
+
+# Rede contra regressões grosseiras de inicialização (folga para CI lento);
+# a guarda principal é a checagem de sys.modules.
+LIMITE_SEGUNDOS = 1.5
+
+# Roda o main.py no próprio processo filho e informa quais módulos pesados carregou
+SONDA = """
+import json, runpy, sys
+sys.argv = [sys.argv[1]] + sys.argv[2:]
+codigo = 0
+try:
+    runpy.run_path(sys.argv[0], run_name="__main__")
+except SystemExit as e:
+    codigo = e.code or 0
+print(json.dumps({"codigo": codigo, "pesados": [m for m in %r if m in sys.modules]}))
+""" % (PESADOS,)
+
+
+def _rodar(*args):
+    inicio = time.perf_counter()
+    proc = subprocess.run(
+        [sys.executable, "-c", SONDA, str(MAIN), *args],
+        capture_output=True,
+        text=True,
+        timeout=60,
+    )
+    decorrido = time.perf_counter() - inicio
+    assert proc.returncode == 0, proc.stderr
+    return json.loads(proc.stdout.strip().splitlines()[-1]), decorrido
+
+
+@pytest.fixture
+def config(tmp_path):
+    (tmp_path / "pdfs").mkdir()
+    path = tmp_path / "config.json"
+    path.write_text(json.dumps({
+        "paths": {
+            "pdf_input_dir": str(tmp_path / "pdfs"),
+            "excel_output_path": str(tmp_path / "historico.xlsx"),
+        },
+        "excel": {"sheet_name": "Plan1"},
+    }), encoding="utf-8")
+    return path
+
+
+def test_help_nao_importa_dependencias_pesadas():
+    resultado, decorrido = _rodar("--help")
+
+    assert resultado["codigo"] == 0
+    assert resultado["pesados"] == []
+    assert decorrido < LIMITE_SEGUNDOS
+
+
+def test_validate_config_nao_importa_dependencias_pesadas(config):
+    resultado, decorrido = _rodar("validate-config", "--config", str(config))
+
+    assert resultado["codigo"] == 0
+    assert resultado["pesados"] == []
+    assert decorrido < LIMITE_SEGUNDOS